@@ -6,6 +6,7 @@ from logging.config import fileConfig
 
 from alembic import context
 from sqlalchemy import engine_from_config, pool
+from sqlalchemy.engine.url import make_url
 
 # Alembic Config
 config = context.config
@@ -49,6 +50,10 @@ def run_migrations_offline() -> None:
 def run_migrations_online() -> None:
     configuration = config.get_section(config.config_ini_section, {})  # type: ignore[arg-type]
     configuration["sqlalchemy.url"] = _get_database_url()
+    # psycopg2: executemany を複数VALUES/バッチ実行に展開する（データ移行の一括INSERT/UPDATE用）
+    # psycopg2 専用の引数のため、他のドライバでは渡さない（create_engine が失敗する）
+    if make_url(configuration["sqlalchemy.url"]).get_driver_name() == "psycopg2":
+        configuration.setdefault("sqlalchemy.executemany_mode", "values_plus_batch")
 
     connectable = engine_from_config(
         configuration,
@@ -61,6 +66,8 @@ def run_migrations_online() -> None:
             connection=connection,
             target_metadata=target_metadata,
             compare_type=True,
+            # revision ごとに commit し、DDL のロックを後続 revision（データ移行を含む）の間まで保持しない
+            transaction_per_migration=True,
         )
 
         with context.begin_transaction():
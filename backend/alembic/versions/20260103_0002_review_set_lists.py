@@ -44,49 +44,83 @@ def upgrade() -> None:
     op.create_index("ix_review_set_items_set_list_id", "review_set_items", ["set_list_id"])
 
     # 可能な範囲で旧データ(settings.review_timing)から初期移行
+    # SAVEPOINT 内で実行し、途中で失敗したら lists/items をまとめて巻き戻す
+    # （リストだけ残ると、アプリ側フォールバックは「空のとき」しか生成しないため修復できない）
     bind = op.get_bind()
     try:
-        row = bind.execute(sa.text("SELECT value FROM settings WHERE key = :k"), {"k": "review_timing"}).fetchone()
-        if not row:
-            return
-        raw = row[0]
-        parsed = json.loads(raw)
-        if not isinstance(parsed, list):
-            return
-
-        # 既に何か入っている場合は移行しない
-        existing = bind.execute(sa.text("SELECT COUNT(*) FROM review_set_lists")).scalar()
-        if int(existing or 0) > 0:
-            return
-
-        for timing in parsed:
-            if not isinstance(timing, dict):
-                continue
-            subject_name = str(timing.get("subject_name") or "").strip()
-            review_days = timing.get("review_days") or []
-            if not subject_name or not isinstance(review_days, list) or len(review_days) == 0:
-                continue
+        with bind.begin_nested():
+            _backfill_from_legacy_review_timing(bind)
+    except Exception:
+        # 移行失敗は致命ではない（テーブルは空のまま残り、アプリ側フォールバックが生成する）
+        pass
+
 
-            name = f"{subject_name}（旧）"
-            rs_id = bind.execute(
-                sa.text("INSERT INTO review_set_lists (name) VALUES (:name) RETURNING id"),
-                {"name": name},
-            ).scalar()
-            if not rs_id:
+def _backfill_from_legacy_review_timing(bind) -> None:
+    row = bind.execute(sa.text("SELECT value FROM settings WHERE key = :k"), {"k": "review_timing"}).fetchone()
+    if not row:
+        return
+    raw = row[0]
+    parsed = json.loads(raw)
+    if not isinstance(parsed, list):
+        return
+
+    # 既に何か入っている場合は移行しない
+    existing = bind.execute(sa.text("SELECT COUNT(*) FROM review_set_lists")).scalar()
+    if int(existing or 0) > 0:
+        return
+
+    # lists / items とも1行ずつ INSERT せず、それぞれ executemany の1文で投入する（往復回数削減）
+    # - 同じ科目名が複数あり得るため、lists の id は名前ではなく投入順で items に対応付ける
+    list_names: list[str] = []
+    list_offsets: list[list[int]] = []
+    for timing in parsed:
+        if not isinstance(timing, dict):
+            continue
+        subject_name = str(timing.get("subject_name") or "").strip()
+        review_days = timing.get("review_days") or []
+        if not subject_name or not isinstance(review_days, list) or len(review_days) == 0:
+            continue
+
+        offsets: list[int] = []
+        for day in review_days:
+            try:
+                offsets.append(int(day))
+            except Exception:
                 continue
+        list_names.append(f"{subject_name}（旧）")
+        list_offsets.append(offsets)
 
-            for day in review_days:
-                try:
-                    offset = int(day)
-                except Exception:
-                    continue
-                bind.execute(
-                    sa.text("INSERT INTO review_set_items (set_list_id, offset_days) VALUES (:sid, :off)"),
-                    {"sid": int(rs_id), "off": int(offset)},
-                )
-    except Exception:
-        # 移行失敗は致命ではない（アプリ側フォールバックがある）
-        pass
+    if not list_names:
+        return
+
+    # Core insert() + 複数行パラメータ → insertmanyvalues で複数VALUESの1文に展開される
+    # sort_by_parameter_order=True で RETURNING の id がパラメータの順に並ぶ
+    metadata = sa.MetaData()
+    review_set_lists = sa.Table(
+        "review_set_lists",
+        metadata,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String(200)),
+    )
+    review_set_items = sa.Table(
+        "review_set_items",
+        metadata,
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("set_list_id", sa.Integer),
+        sa.Column("offset_days", sa.Integer),
+    )
+    list_ids = bind.execute(
+        sa.insert(review_set_lists).returning(review_set_lists.c.id, sort_by_parameter_order=True),
+        [{"name": name} for name in list_names],
+    ).scalars().all()
+
+    item_rows = [
+        {"set_list_id": int(rs_id), "offset_days": offset}
+        for rs_id, offsets in zip(list_ids, list_offsets)
+        for offset in offsets
+    ]
+    if item_rows:
+        bind.execute(sa.insert(review_set_items), item_rows)
 
 
 def downgrade() -> None:
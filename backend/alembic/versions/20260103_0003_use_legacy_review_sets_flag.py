@@ -12,42 +12,29 @@ from __future__ import annotations
 
 from alembic import op
 import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 revision = "20260103_0003"
 down_revision = "20260103_0002"
 branch_labels = None
 depends_on = None
 
+# 未設定の場合のみ投入する初期設定（既存行は ON CONFLICT DO NOTHING で維持）
+_DEFAULT_SETTINGS = [
+    {"key": "use_legacy_review_sets", "value": "true"},
+]
+
 
 def upgrade() -> None:
-    bind = op.get_bind()
-    dialect = bind.dialect.name
-
-    if dialect == "postgresql":
-        bind.execute(
-            sa.text(
-                """
-                INSERT INTO settings (key, value)
-                VALUES (:k, :v)
-                ON CONFLICT (key) DO NOTHING
-                """
-            ),
-            {"k": "use_legacy_review_sets", "v": "true"},
-        )
-    else:
-        # SQLite 等: 既存行があれば無視
-        bind.execute(
-            sa.text(
-                """
-                INSERT OR IGNORE INTO settings (key, value)
-                VALUES (:k, :v)
-                """
-            ),
-            {"k": "use_legacy_review_sets", "v": "true"},
-        )
+    # Alembic の対象は PostgreSQL のみ（env.py は DATABASE_URL 必須）
+    # 初期値が増えても values([...]) に足すだけで1文・1往復のまま
+    settings = sa.table("settings", sa.column("key", sa.String), sa.column("value", sa.Text))
+    op.execute(
+        pg_insert(settings)
+        .values(_DEFAULT_SETTINGS)
+        .on_conflict_do_nothing(index_elements=["key"])
+    )
 
 
 def downgrade() -> None:
     raise RuntimeError("downgrade is disabled for data safety")
-
-
@@ -0,0 +1,84 @@
+"""study_progress 互換VIEWの合成IDを row_number から決定的ハッシュへ変更
+
+Revision ID: 20260106_0006
+Revises: 20260105_0005
+Create Date: 2026-01-06
+
+目的:
+- 互換VIEW (study_progress) の学習時間行は `-row_number() OVER (ORDER BY subject, date_key)` で
+  合成IDを振っていたため、VIEW を読むたびに集計結果全体のソートが発生していた
+- (subject, date_key) の md5 から決定的にIDを作ることで、ウィンドウ関数とソートを不要にする
+
+方針:
+- ID は md5 先頭 13 桁(52bit) を使い、-1 .. -2^52 の負数にする
+  - legacy 行（正のID）とは衝突しない
+  - JavaScript の Number でも精度落ちしない範囲に収める
+- 52bit 値は integer に収まらないため id 列を bigint にする（列型が変わるので DROP → CREATE）
+- 行の内容・並び以外の列定義は 20260104_0004 と同一
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260106_0006"
+down_revision = "20260105_0005"
+branch_labels = None
+depends_on = None
+
+
+_VIEW_TEMPLATE = """
+CREATE VIEW study_progress AS
+SELECT
+    sp.id::{id_type} AS id,
+    sp.subject::varchar(100) AS subject,
+    sp.topic::varchar(200) AS topic,
+    sp.progress_percent::double precision AS progress_percent,
+    sp.study_hours::double precision AS study_hours,
+    sp.notes::text AS notes,
+    sp.actual_time::double precision AS actual_time,
+    sp.target_time::double precision AS target_time,
+    sp.variance_reason::varchar(200) AS variance_reason,
+    sp.theory_calculation_ratio::double precision AS theory_calculation_ratio,
+    sp.created_at::timestamptz AS created_at,
+    sp.updated_at::timestamptz AS updated_at
+FROM study_progress_legacy sp
+WHERE sp.topic <> '学習時間'
+UNION ALL
+SELECT
+    {synthetic_id} AS id,
+    sts.subject::varchar(100) AS subject,
+    '学習時間'::varchar(200) AS topic,
+    NULL::double precision AS progress_percent,
+    (SUM(sts.last_total_ms)::double precision / 3600000.0)::double precision AS study_hours,
+    NULL::text AS notes,
+    NULL::double precision AS actual_time,
+    NULL::double precision AS target_time,
+    NULL::varchar(200) AS variance_reason,
+    NULL::double precision AS theory_calculation_ratio,
+    ((sts.date_key || ' 00:00:00+09')::timestamptz) AS created_at,
+    ((sts.date_key || ' 00:00:00+09')::timestamptz) AS updated_at
+FROM study_time_sync_sessions sts
+WHERE sts.user_id = 'default'
+GROUP BY sts.subject, sts.date_key
+;
+"""
+
+# (subject, date_key) -> -1 .. -2^52 の決定的ID
+_HASH_ID = (
+    "(-(('x' || lpad(substr(md5(sts.subject || '/' || sts.date_key), 1, 13), 16, '0'))"
+    "::bit(64)::bigint) - 1)::bigint"
+)
+
+# 20260104_0004 の定義（downgrade 用）
+_ROW_NUMBER_ID = "(-row_number() OVER (ORDER BY sts.subject, sts.date_key))::integer"
+
+
+def upgrade() -> None:
+    op.execute("DROP VIEW IF EXISTS study_progress;")
+    op.execute(_VIEW_TEMPLATE.format(id_type="bigint", synthetic_id=_HASH_ID))
+
+
+def downgrade() -> None:
+    op.execute("DROP VIEW IF EXISTS study_progress;")
+    op.execute(_VIEW_TEMPLATE.format(id_type="integer", synthetic_id=_ROW_NUMBER_ID))
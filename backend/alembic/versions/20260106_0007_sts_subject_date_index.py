@@ -0,0 +1,46 @@
+"""study_time_sync_sessions: 互換VIEW集計用の複合部分インデックス
+
+Revision ID: 20260106_0007
+Revises: 20260106_0006
+Create Date: 2026-01-06
+
+目的:
+- 互換VIEW (study_progress) は `WHERE user_id = 'default' GROUP BY subject, date_key` で
+  study_time_sync_sessions を集計する
+- 単一列の subject / date_key インデックスではこのアクセスパターンを賄えないため、
+  (subject, date_key) INCLUDE (last_total_ms) の部分インデックスで Index Only Scan にする
+
+方針:
+- ix_study_time_sync_sessions_subject / ix_study_time_sync_sessions_date_key は削除する
+  - subject は新インデックスの先頭列で代替できる
+  - date_key の範囲検索は user_id 条件付きでしか行わないため uq_study_time_sync (user_id, date_key, ...) で代替できる
+  - 書き込み（タイマー同期）ごとのインデックス更新コストを減らす
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20260106_0007"
+down_revision = "20260106_0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_sts_default_subject_date",
+        "study_time_sync_sessions",
+        ["subject", "date_key"],
+        postgresql_where=sa.text("user_id = 'default'"),
+        postgresql_include=["last_total_ms"],
+    )
+    op.drop_index("ix_study_time_sync_sessions_subject", table_name="study_time_sync_sessions")
+    op.drop_index("ix_study_time_sync_sessions_date_key", table_name="study_time_sync_sessions")
+
+
+def downgrade() -> None:
+    op.create_index("ix_study_time_sync_sessions_date_key", "study_time_sync_sessions", ["date_key"])
+    op.create_index("ix_study_time_sync_sessions_subject", "study_time_sync_sessions", ["subject"])
+    op.drop_index("ix_sts_default_subject_date", table_name="study_time_sync_sessions")
@@ -0,0 +1,32 @@
+"""todos: 一覧の並び順 (completed, created_at DESC, id DESC) 用の複合インデックス
+
+Revision ID: 20260107_0008
+Revises: 20260106_0007
+Create Date: 2026-01-07
+
+目的:
+- /api/todos は completed ASC, created_at DESC, id DESC で並べ、cursor（並びキー）による keyset ページングを行う
+- 並びと同じ列順・方向の複合インデックスで、ソートなしの単一インデックス範囲スキャンにする
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20260107_0008"
+down_revision = "20260106_0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_todos_completed_created_id",
+        "todos",
+        ["completed", sa.text("created_at DESC"), sa.text("id DESC")],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_todos_completed_created_id", table_name="todos")
@@ -0,0 +1,85 @@
+"""study_time_subject_totals: 科目別学習時間のロールアップテーブル
+
+Revision ID: 20260107_0009
+Revises: 20260107_0008
+Create Date: 2026-01-07
+
+目的:
+- 科目別集計 (get_subjects_summary / /api/summary) は毎回 study_time_sync_sessions 全件を
+  user_id, subject で GROUP BY していたため、履歴が増えるほど重くなる
+- (user_id, subject) ごとの合計を study_time_subject_totals に保持し、集計を数行の読み取りにする
+
+方針:
+- 合計の維持は study_time_sync_sessions のトリガーで行う
+  - アプリ (sync_study_time_total_ms) 以外の書き込み（SQLite→Postgres移行スクリプト、手動修正）でもずれない
+- session_count は削除で0件になった科目を集計から除外するために保持する
+- 既存データは upgrade 時に集計して投入する
+- downgrade は派生データのみを削除する（元データには触れない）
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20260107_0009"
+down_revision = "20260107_0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "study_time_subject_totals",
+        sa.Column("user_id", sa.String(length=100), primary_key=True, nullable=False),
+        sa.Column("subject", sa.String(length=100), primary_key=True, nullable=False),
+        sa.Column("total_ms", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("session_count", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+    op.execute(
+        """
+        CREATE FUNCTION study_time_subject_totals_apply() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE study_time_subject_totals
+                SET total_ms = total_ms - OLD.last_total_ms,
+                    session_count = session_count - 1
+                WHERE user_id = OLD.user_id AND subject = OLD.subject;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO study_time_subject_totals (user_id, subject, total_ms, session_count)
+                VALUES (NEW.user_id, NEW.subject, NEW.last_total_ms, 1)
+                ON CONFLICT (user_id, subject) DO UPDATE
+                SET total_ms = study_time_subject_totals.total_ms + EXCLUDED.total_ms,
+                    session_count = study_time_subject_totals.session_count + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER trg_study_time_subject_totals
+        AFTER INSERT OR DELETE OR UPDATE OF user_id, subject, last_total_ms
+        ON study_time_sync_sessions
+        FOR EACH ROW EXECUTE FUNCTION study_time_subject_totals_apply();
+        """
+    )
+
+    # 既存データの初期集計
+    op.execute(
+        """
+        INSERT INTO study_time_subject_totals (user_id, subject, total_ms, session_count)
+        SELECT user_id, subject, COALESCE(SUM(last_total_ms), 0), COUNT(*)
+        FROM study_time_sync_sessions
+        GROUP BY user_id, subject;
+        """
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS trg_study_time_subject_totals ON study_time_sync_sessions;")
+    op.execute("DROP FUNCTION IF EXISTS study_time_subject_totals_apply();")
+    op.drop_table("study_time_subject_totals")
@@ -0,0 +1,44 @@
+"""study_time_sync_sessions: 今日/今週合計・ダッシュボード集計用のカバリングインデックス
+
+Revision ID: 20260107_0010
+Revises: 20260107_0009
+Create Date: 2026-01-07
+
+目的:
+- get_study_time_summary_ms は `WHERE user_id = :u AND date_key (= | BETWEEN) ...` で
+  SUM(last_total_ms) を取る
+- get_dashboard_summary は `WHERE user_id = :u AND date_key の範囲` を `GROUP BY date_key, subject` で集計する
+- uq_study_time_sync (user_id, date_key, ...) で範囲は絞れるが、last_total_ms を含まないため
+  ヒープ参照が発生する
+- (user_id, date_key, subject) INCLUDE (last_total_ms) で、どちらも Index Only Scan にする
+
+方針:
+- 等値条件の user_id を先頭、範囲条件の date_key を後ろに置く（subject は集計キー）
+- ix_study_time_sync_sessions_user_id (user_id 単体) は新インデックスの先頭列で代替できるため削除する
+- uq_study_time_sync (user_id, date_key, subject, client_session_id) は ON CONFLICT の対象として残す
+  （INCLUDE 列が無いため集計のカバリングには使えない）
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260107_0010"
+down_revision = "20260107_0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_sts_user_date_subject",
+        "study_time_sync_sessions",
+        ["user_id", "date_key", "subject"],
+        postgresql_include=["last_total_ms"],
+    )
+    op.drop_index("ix_study_time_sync_sessions_user_id", table_name="study_time_sync_sessions")
+
+
+def downgrade() -> None:
+    op.create_index("ix_study_time_sync_sessions_user_id", "study_time_sync_sessions", ["user_id"])
+    op.drop_index("ix_sts_user_date_subject", table_name="study_time_sync_sessions")
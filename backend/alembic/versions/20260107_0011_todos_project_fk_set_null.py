@@ -0,0 +1,35 @@
+"""todos.project_id: プロジェクト削除時に DB 側で NULL にする
+
+Revision ID: 20260107_0011
+Revises: 20260107_0010
+Create Date: 2026-01-07
+
+目的:
+- delete_project はプロジェクト削除の前に、紐づく ToDo の project_id を NULL にする UPDATE を別途発行していた
+- 外部キーを ON DELETE SET NULL にし、DELETE 1文の中で DB に同じ処理をさせる
+
+方針:
+- 既存の外部キー (todos_project_id_fkey) を張り直す
+- downgrade では ON DELETE 指定なし（NO ACTION）に戻す
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260107_0011"
+down_revision = "20260107_0010"
+branch_labels = None
+depends_on = None
+
+_FK_NAME = "todos_project_id_fkey"
+
+
+def upgrade() -> None:
+    op.drop_constraint(_FK_NAME, "todos", type_="foreignkey")
+    op.create_foreign_key(_FK_NAME, "todos", "projects", ["project_id"], ["id"], ondelete="SET NULL")
+
+
+def downgrade() -> None:
+    op.drop_constraint(_FK_NAME, "todos", type_="foreignkey")
+    op.create_foreign_key(_FK_NAME, "todos", "projects", ["project_id"], ["id"])
@@ -0,0 +1,39 @@
+"""todos.project_id / review_set_items (set_list_id, id) の複合インデックス
+
+Revision ID: 20260108_0013
+Revises: 20260107_0011
+Create Date: 2026-01-08
+
+目的:
+- todos.project_id にはインデックスが無く、次の処理が todos 全体の Seq Scan になっていた
+  - プロジェクト完了: `UPDATE todos ... WHERE project_id = :pid AND completed = false`
+  - プロジェクト削除: 外部キー todos_project_id_fkey の ON DELETE SET NULL（project_id = :pid の検索）
+- ReviewSetList.items の selectin ロードは `WHERE set_list_id IN (...) ORDER BY id` で、
+  set_list_id 単体のインデックスでは並べ替えが残っていた
+
+方針:
+- todos: (project_id, completed) を追加する（完了の一括UPDATEは両列、ON DELETE は先頭列で使う）
+- review_set_items: (set_list_id, id) は ix_review_set_items_set_list_id の上位互換なので置き換える
+- study_progress は VIEW（実体は study_progress_legacy / study_time_sync_sessions）のため対象外
+"""
+
+from __future__ import annotations
+
+from alembic import op
+
+revision = "20260108_0013"
+down_revision = "20260107_0011"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_todos_project_completed", "todos", ["project_id", "completed"])
+    op.create_index("ix_review_set_items_set_list_id_id", "review_set_items", ["set_list_id", "id"])
+    op.drop_index("ix_review_set_items_set_list_id", table_name="review_set_items")
+
+
+def downgrade() -> None:
+    op.create_index("ix_review_set_items_set_list_id", "review_set_items", ["set_list_id"])
+    op.drop_index("ix_review_set_items_set_list_id_id", table_name="review_set_items")
+    op.drop_index("ix_todos_project_completed", table_name="todos")
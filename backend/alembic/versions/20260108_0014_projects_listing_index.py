@@ -0,0 +1,38 @@
+"""projects: 一覧の並び順 (due_date, created_at DESC, id DESC) 用の複合インデックス
+
+Revision ID: 20260108_0014
+Revises: 20260108_0013
+Create Date: 2026-01-08
+
+目的:
+- /api/projects は due_date ASC NULLS LAST, created_at DESC, id DESC で並べ、cursor による keyset ページングを行う
+- インデックスが無く、ページごとに全件を並べ替えていた
+- 並びと同じ列順・方向の複合インデックスで、カーソル以降の各範囲（同じ due_date の続き / due_date > カーソル /
+  due_date IS NULL）をソートなしの範囲スキャンにする
+
+方針:
+- due_date ASC は既定で NULLS LAST、created_at/id の DESC は既定で NULLS FIRST（ORDER BY と一致）
+- completed = false の絞り込みはフィルタで行う（プロジェクト数は少なく、部分インデックスにはしない）
+"""
+
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = "20260108_0014"
+down_revision = "20260108_0013"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_projects_due_created_id",
+        "projects",
+        ["due_date", sa.text("created_at DESC"), sa.text("id DESC")],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_projects_due_created_id", table_name="projects")
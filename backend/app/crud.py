@@ -1,54 +1,193 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, aliased, raiseload, selectinload
+import base64
 import logging
+import os
+import re
+import threading
+import time
 from . import models, schemas
-from datetime import datetime, timedelta, timezone
+from datetime import date, datetime, timedelta, timezone
+from collections import OrderedDict
+from functools import lru_cache
 import json
 import sqlalchemy as sa
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import ProgrammingError
 
 logger = logging.getLogger(__name__)
 
+# Pydantic v1/v2 の判定は import 時に1回だけ行う
+_PYDANTIC_V2 = hasattr(schemas.TodoUpdate, "model_dump")
+
+
+def _fields_set(obj):
+    return obj.model_fields_set if _PYDANTIC_V2 else obj.__fields_set__
+
+
+def _dump_unset(obj) -> dict:
+    """
+    リクエストで明示的に指定されたフィールドだけを dict 化する。
+    Update スキーマはフラットなスカラー項目だけなので、model_dump のシリアライズ処理を通さず
+    fields_set の属性を読むだけにする（exclude_unset=True の dump と同じ結果）。
+    """
+    return {f: getattr(obj, f) for f in _fields_set(obj)}
+
+
+def _dump_set(obj):
+    """
+    _dump_unset の結果を fields_set と合わせて返す。
+    """
+    return _dump_unset(obj), _fields_set(obj)
+
+
+def _field_names(schema_cls) -> tuple[str, ...]:
+    return tuple(schema_cls.model_fields if _PYDANTIC_V2 else schema_cls.__fields__)
+
+
+# create_* で ORM に渡す列名（スキーマ定義から import 時に1回だけ求める）
+_TODO_CREATE_FIELDS = _field_names(schemas.TodoCreate)
+_PROJECT_CREATE_FIELDS = _field_names(schemas.ProjectCreate)
+_STUDY_PROGRESS_CREATE_FIELDS = _field_names(schemas.StudyProgressCreate)
+
+
+# 開発/検証用: STRICT_LOADING=1 のとき、一覧取得で明示していないリレーションの遅延ロードを例外にする
+# （シリアライズ時の想定外の N+1 を本番前に検出する。未設定なら何もしない）
+_STRICT_LOADING = os.getenv("STRICT_LOADING") == "1"
+
+
+def _strict_loading(query, *eager):
+    """一覧クエリに STRICT_LOADING 用のロードオプションを付ける。eager には必要なリレーションのロード指定を渡す"""
+    if not _STRICT_LOADING:
+        return query
+    return query.options(*eager, raiseload("*"))
+
+
+def _create_kwargs(obj, fields: tuple[str, ...]) -> dict:
+    """
+    フラットな Create スキーマを ORM コンストラクタ用の dict にする。
+    model_dump() のようなシリアライズ処理を通さず、属性を読むだけにする。
+    """
+    return {f: getattr(obj, f) for f in fields}
+
+
+# ----------------------------
+# Keyset ページング（一覧のカーソル）
+# ----------------------------
+
+def _encode_cursor(kind: str, *sort_key) -> str:
+    """
+    一覧の並びキー（ページ最後の行の値）をカーソル文字列にする。
+    行を ID で引き直さないため、ページ取得の間に行が更新/削除されても続きの位置はずれない。
+    """
+    values = [kind, *(v.isoformat() if isinstance(v, datetime) else v for v in sort_key)]
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(kind: str, cursor: str, size: int) -> list:
+    """_encode_cursor の逆。形式が不正、または別の一覧のカーソルなら ValueError"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as e:  # binascii.Error / UnicodeDecodeError / JSONDecodeError
+        raise ValueError(f"invalid cursor: {cursor!r}") from e
+    if not isinstance(values, list) or len(values) != size + 1 or values[0] != kind:
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return values[1:]
+
+
+def _cursor_datetime(value) -> datetime | None:
+    if value is None:
+        return None
+    if not isinstance(value, str):
+        raise ValueError(f"invalid cursor datetime: {value!r}")
+    return datetime.fromisoformat(value)
+
+
+def _cursor_id(value) -> int:
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"invalid cursor id: {value!r}")
+    return value
+
+
+def _seek_created_desc(created_at, id_col, ts: datetime | None, last_id: int) -> list:
+    """
+    (created_at DESC, id DESC) の並び（PostgreSQL の DESC は NULLS FIRST）で (ts, last_id) より後ろの範囲。
+    OR でつなぐとインデックスの範囲検索にならないため、連続する範囲ごとの条件を並び順に返す。
+    """
+    if ts is None:
+        return [sa.and_(created_at.is_(None), id_col < last_id), created_at.is_not(None)]
+    return [sa.tuple_(created_at, id_col) < sa.tuple_(ts, last_id)]
+
+
+def _keyset_page(db: Session, model, order_by, ranges: list, where: tuple, skip: int, limit: int):
+    """
+    ranges（並び順に連続する範囲の条件）をそれぞれ skip + limit 件までのインデックス範囲走査にし、
+    UNION ALL の1文にまとめて、先頭 skip 件を除いた limit 件を返す（全体を OFFSET で読み捨てない）。
+    - order_by: エンティティ（model または UNION の別名）から ORDER BY 句を返す関数
+    """
+    n = skip + limit
+    parts = [sa.select(model).where(*where, r).order_by(*order_by(model)).limit(n) for r in ranges]
+    row = aliased(model, sa.union_all(*parts).subquery())
+    stmt = _strict_loading(sa.select(row)).order_by(*order_by(row)).offset(skip).limit(limit)
+    return db.scalars(stmt).all()
+
+
+# 存在を確認済みの (id(engine), table_name)
+# テーブルは一度作られれば消えないため True のみ覚える。False はマイグレーション適用後に変わり得るので毎回確認する
+_existing_tables: set[tuple[int, str]] = set()
+
+
 def _has_table(db: Session, table_name: str) -> bool:
     """
     現DBに指定テーブルが存在するかを返す（PostgreSQL想定）。
     VIEW / table の判別まではしない（存在チェックのみ）。
+    一度存在を確認したテーブルはエンジンごとに覚え、以後DBに問い合わせない。
+    """
+    bind = db.get_bind()
+    cache_key = (id(getattr(bind, "engine", bind)), table_name)
+    if cache_key in _existing_tables:
+        return True
+    if _lookup_table(db, table_name):
+        _existing_tables.add(cache_key)
+        return True
+    return False
+
+
+def _lookup_table(db: Session, table_name: str) -> bool:
+    """
+    _has_table の実処理（キャッシュなし）。
+    to_regclass はシステムカタログのキャッシュで名前解決するため、information_schema を走査しない。
     """
     try:
-        exists = db.execute(
-            sa.text(
-                """
-                SELECT 1
-                FROM information_schema.tables
-                WHERE table_schema = 'public' AND table_name = :t
-                LIMIT 1
-                """
-            ),
-            {"t": table_name},
-        ).scalar()
-        if exists:
-            return True
-    except Exception:
-        # information_schema が読めない環境でも落とさない
-        pass
-    # fallback: SQLAlchemy inspector
-    try:
-        insp = sa.inspect(db.get_bind())
-        return table_name in insp.get_table_names(schema="public")
+        return bool(
+            db.execute(sa.text("SELECT to_regclass(:q) IS NOT NULL"), {"q": f"public.{table_name}"}).scalar()
+        )
     except Exception:
         return False
 
 
+# models に StudyProgressLegacy が定義されているかはプロセス中で変わらないため import 時に解決する
+_STUDY_PROGRESS_LEGACY_MODEL = getattr(models, "StudyProgressLegacy", None)
+
+
 def _study_progress_write_model(db: Session):
     """
     書き込み先の StudyProgress モデルを返す。
     - migration適用後: `study_progress_legacy`（実体テーブル）
     - 適用前: `study_progress`（実体テーブル）
     """
-    if hasattr(models, "StudyProgressLegacy") and _has_table(db, "study_progress_legacy"):
-        return models.StudyProgressLegacy
+    if _STUDY_PROGRESS_LEGACY_MODEL is not None and _has_table(db, "study_progress_legacy"):
+        return _STUDY_PROGRESS_LEGACY_MODEL
     return models.StudyProgress
 
 
+_BOOL_SETTING_VALUES = {
+    **dict.fromkeys(("true", "1", "yes", "y", "t"), True),
+    **dict.fromkeys(("false", "0", "no", "n", "f"), False),
+}
+
+
 def _get_bool_setting(db: Session, key: str, default: bool) -> bool:
     """
     settings(key-value) に保存された boolean フラグを読む。
@@ -58,22 +197,8 @@ def _get_bool_setting(db: Session, key: str, default: bool) -> bool:
     s = get_setting(db, key)
     if not s:
         return default
-    raw = (s.value or "").strip()
-    if raw == "":
-        return default
-    # JSONのtrue/falseが入っているケース
-    try:
-        parsed = json.loads(raw)
-        if isinstance(parsed, bool):
-            return parsed
-    except Exception:
-        pass
-    low = raw.lower()
-    if low in ("true", "1", "yes", "y", "t"):
-        return True
-    if low in ("false", "0", "no", "n", "f"):
-        return False
-    return default
+    # JSON の true/false もそのまま "true"/"false" として引ける
+    return _BOOL_SETTING_VALUES.get((s.value or "").strip().lower(), default)
 
 
 def _get_visible_subject_names_from_settings(db: Session) -> list[str] | None:
@@ -109,11 +234,17 @@ def _get_visible_subject_names_from_settings(db: Session) -> list[str] | None:
 
 def get_study_progress(db: Session, progress_id: int):
     """IDで進捗を取得"""
-    return db.query(models.StudyProgress).filter(models.StudyProgress.id == progress_id).first()
+    return db.get(models.StudyProgress, progress_id)
 
-def get_all_study_progress(db: Session, skip: int = 0, limit: int = 100):
-    """すべての進捗を取得"""
-    return db.query(models.StudyProgress).offset(skip).limit(limit).all()
+def get_all_study_progress(db: Session, skip: int = 0, limit: int = 100, after_id: int | None = None):
+    """
+    すべての進捗を取得（ID順）
+    - after_id 指定時は keyset ページング（そのIDより後ろから limit 件）
+    """
+    q = db.query(models.StudyProgress)
+    if after_id is not None:
+        q = q.filter(models.StudyProgress.id > after_id)
+    return q.order_by(models.StudyProgress.id.asc()).offset(skip).limit(limit).all()
 
 def get_study_progress_by_subject(db: Session, subject: str):
     """科目で進捗を取得"""
@@ -122,82 +253,79 @@ def get_study_progress_by_subject(db: Session, subject: str):
 def create_study_progress(db: Session, progress: schemas.StudyProgressCreate):
     """新しい進捗を作成"""
     WriteModel = _study_progress_write_model(db)
-    db_progress = WriteModel(**progress.dict())
+    db_progress = WriteModel(**_create_kwargs(progress, _STUDY_PROGRESS_CREATE_FIELDS))
     db.add(db_progress)
     db.commit()
-    db.refresh(db_progress)
     return db_progress
 
 def update_study_progress(db: Session, progress_id: int, progress_update: schemas.StudyProgressUpdate):
     """進捗を更新"""
     # VIEW (study_progress) 経由だと書き込み不可になるため、legacyに寄せる
     WriteModel = _study_progress_write_model(db)
-    db_progress = db.query(WriteModel).filter(WriteModel.id == progress_id).first()
-    if db_progress is None:
-        return None
-    
-    update_data = progress_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_progress, field, value)
-    
+    update_data = _dump_unset(progress_update)
+    if not update_data:
+        return db.get(WriteModel, progress_id)
+
+    # UPDATE ... RETURNING で存在確認・更新・再取得を1往復にまとめる
+    db_progress = db.execute(
+        sa.update(WriteModel)
+        .where(WriteModel.id == progress_id)
+        .values(**update_data)
+        .returning(WriteModel)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(db_progress)
     return db_progress
 
 def delete_study_progress(db: Session, progress_id: int):
     """進捗を削除"""
     WriteModel = _study_progress_write_model(db)
-    db_progress = db.query(WriteModel).filter(WriteModel.id == progress_id).first()
-    if db_progress is None:
-        return None
-    
-    db.delete(db_progress)
+    db_progress = db.execute(
+        sa.delete(WriteModel).where(WriteModel.id == progress_id).returning(WriteModel)
+    ).scalar_one_or_none()
     db.commit()
     return db_progress
 
 def get_subjects_summary(db: Session, user_id: str = "default"):
     """科目ごとの集計を取得"""
-    from sqlalchemy import func
-
     # 1) 進捗系（学習時間以外）は study_progress VIEW（= legacy + time互換行）から取得
     #    time互換行は progress_percent が NULL なので avg を汚しにくい
-    progress_rows = (
-        db.query(
+    progress_q = (
+        sa.select(
             models.StudyProgress.subject.label("subject"),
             func.count(models.StudyProgress.id).label("count"),
             func.avg(models.StudyProgress.progress_percent).label("avg_progress"),
         )
-        .filter(models.StudyProgress.topic != "学習時間")
+        .where(models.StudyProgress.topic != "学習時間")
         .group_by(models.StudyProgress.subject)
-        .all()
+        .subquery("p")
     )
-    progress_map = {
-        r.subject: {"count": int(r.count or 0), "avg_progress": float(r.avg_progress or 0.0)}
-        for r in progress_rows
-    }
 
-    # 2) 学習時間は study_time_sync_sessions のみを正として集計する（UTCズレ回避）
-    time_rows = (
-        db.query(
-            models.StudyTimeSyncSession.subject.label("subject"),
-            func.sum(models.StudyTimeSyncSession.last_total_ms).label("total_ms"),
+    # 2) 学習時間は study_time_sync_sessions のみを正とする（UTCズレ回避）
+    #    科目別合計はトリガーで維持されるロールアップ (study_time_subject_totals) から読む
+    time_q = (
+        sa.select(
+            models.StudyTimeSubjectTotal.subject.label("subject"),
+            sa.cast(models.StudyTimeSubjectTotal.total_ms, sa.Float).label("total_ms"),
         )
-        .filter(models.StudyTimeSyncSession.user_id == user_id)
-        .group_by(models.StudyTimeSyncSession.subject)
-        .all()
+        .where(models.StudyTimeSubjectTotal.user_id == user_id)
+        .where(models.StudyTimeSubjectTotal.session_count > 0)
+        .subquery("t")
     )
-    time_map = {r.subject: float(r.total_ms or 0.0) / 3_600_000.0 for r in time_rows}
 
-    subjects = sorted(set(progress_map.keys()) | set(time_map.keys()))
-    return [
-        {
-            "subject": subject,
-            "count": progress_map.get(subject, {}).get("count", 0),
-            "total_hours": float(time_map.get(subject, 0.0)),
-            "avg_progress": progress_map.get(subject, {}).get("avg_progress", 0.0),
-        }
-        for subject in subjects
-    ]
+    # 両者を FULL OUTER JOIN し、0埋め・時間換算・並び替えまで SQL 側で済ませる
+    # （並びは Python の sorted と同じコードポイント順にするため C collation を使う）
+    subject = func.coalesce(progress_q.c.subject, time_q.c.subject)
+    stmt = (
+        sa.select(
+            subject.label("subject"),
+            func.coalesce(progress_q.c.count, 0).label("count"),
+            (func.coalesce(time_q.c.total_ms, 0.0) / 3_600_000.0).label("total_hours"),
+            func.coalesce(progress_q.c.avg_progress, 0.0).label("avg_progress"),
+        )
+        .select_from(progress_q.join(time_q, progress_q.c.subject == time_q.c.subject, full=True))
+        .order_by(subject.collate("C"))
+    )
+    return db.execute(stmt).mappings().all()
 
 
 def _jst_today_date_key() -> str:
@@ -221,10 +349,8 @@ def get_dashboard_summary(
     - 棒グラフ用: 今週(Mon..Sun)の日別 hours
     - ストリーク: date_key 連続判定（hours > 0）
     """
-    from sqlalchemy import func
-
     base_key = date_key or _jst_today_date_key()
-    base_day = datetime.strptime(base_key, "%Y-%m-%d").date()
+    base_day = _parse_date_key(base_key)
 
     # 1) 週範囲（Mon..Sun）
     week_start = base_day - timedelta(days=base_day.weekday())
@@ -232,51 +358,49 @@ def get_dashboard_summary(
     week_start_key = week_start.isoformat()
     week_end_key = week_end.isoformat()
 
-    week_rows = (
-        db.query(
-            models.StudyTimeSyncSession.date_key.label("date_key"),
-            func.sum(models.StudyTimeSyncSession.last_total_ms).label("total_ms"),
-        )
-        .filter(models.StudyTimeSyncSession.user_id == user_id)
-        .filter(models.StudyTimeSyncSession.date_key >= week_start_key)
-        .filter(models.StudyTimeSyncSession.date_key < week_end_key)
-        .group_by(models.StudyTimeSyncSession.date_key)
-        .all()
-    )
-    week_hours_by_date = {r.date_key: float(r.total_ms or 0.0) / 3_600_000.0 for r in week_rows}
-    week_daily = []
-    for i in range(7):
-        k = (week_start + timedelta(days=i)).isoformat()
-        week_daily.append({"date_key": k, "hours": float(week_hours_by_date.get(k, 0.0))})
+    # 2) ストリーク（直近N日）の範囲
+    if streak_days < 1:
+        streak_days = 1
+    streak_start = base_day - timedelta(days=streak_days - 1)
+    streak_start_key = streak_start.isoformat()
+    streak_end_key = (base_day + timedelta(days=1)).isoformat()
 
-    today_hours = float(week_hours_by_date.get(base_key, 0.0))
-    week_hours = float(sum(d["hours"] for d in week_daily))
+    # 週・週×科目・ストリークは同じ (date_key, subject) 集計の部分集合なので、
+    # 両範囲を覆う1回の GROUP BY で取得し、Python 側で1パスで振り分ける（ms の整数で足してから時間へ換算）
+    sts = models.StudyTimeSyncSession
+    rows = db.execute(
+        sa.select(sts.date_key, sts.subject, func.sum(sts.last_total_ms))
+        .where(sts.user_id == user_id)
+        .where(sts.date_key >= min(week_start_key, streak_start_key))
+        .where(sts.date_key < max(week_end_key, streak_end_key))
+        .group_by(sts.date_key, sts.subject)
+    ).all()
 
-    # 1-b) 週の日別・科目別（積み上げ棒グラフ用）
     visible_subjects = _get_visible_subject_names_from_settings(db)
-    week_subject_rows = (
-        db.query(
-            models.StudyTimeSyncSession.date_key.label("date_key"),
-            models.StudyTimeSyncSession.subject.label("subject"),
-            func.sum(models.StudyTimeSyncSession.last_total_ms).label("total_ms"),
-        )
-        .filter(models.StudyTimeSyncSession.user_id == user_id)
-        .filter(models.StudyTimeSyncSession.date_key >= week_start_key)
-        .filter(models.StudyTimeSyncSession.date_key < week_end_key)
-        .group_by(models.StudyTimeSyncSession.date_key, models.StudyTimeSyncSession.subject)
-        .all()
-    )
-    week_hours_by_date_subject: dict[str, dict[str, float]] = {}
+    week_ms_by_date: dict[str, int] = {}
+    week_ms_by_date_subject: dict[str, dict[str, int]] = {}
+    streak_ms_by_date: dict[str, int] = {}
     subjects_in_week: set[str] = set()
-    for r in week_subject_rows:
-        dk = str(r.date_key)
-        sbj = str(r.subject)
-        if visible_subjects is not None and sbj not in visible_subjects:
-            continue
-        hours = float(r.total_ms or 0.0) / 3_600_000.0
-        week_hours_by_date_subject.setdefault(dk, {})[sbj] = float(week_hours_by_date_subject.get(dk, {}).get(sbj, 0.0) + hours)
-        subjects_in_week.add(sbj)
+    for dk, sbj, total_ms in rows:
+        ms = int(total_ms or 0)
+        if week_start_key <= dk < week_end_key:
+            week_ms_by_date[dk] = week_ms_by_date.get(dk, 0) + ms
+            if visible_subjects is None or sbj in visible_subjects:
+                by_subject = week_ms_by_date_subject.setdefault(dk, {})
+                by_subject[sbj] = by_subject.get(sbj, 0) + ms
+                subjects_in_week.add(sbj)
+        if streak_start_key <= dk < streak_end_key:
+            streak_ms_by_date[dk] = streak_ms_by_date.get(dk, 0) + ms
+
+    # 1) 週の日別（週7日分の date_key は1回だけ作り、日別・科目別の両方で使う）
+    week_keys = [(week_start + timedelta(days=i)).isoformat() for i in range(7)]
+    week_hours_by_date = {k: ms / 3_600_000.0 for k, ms in week_ms_by_date.items()}
+    week_daily = [{"date_key": k, "hours": float(week_hours_by_date.get(k, 0.0))} for k in week_keys]
 
+    today_hours = float(week_hours_by_date.get(base_key, 0.0))
+    week_hours = float(sum(d["hours"] for d in week_daily))
+
+    # 1-b) 週の日別・科目別（積み上げ棒グラフ用）
     if visible_subjects is None:
         subject_order = sorted(subjects_in_week)
     else:
@@ -284,58 +408,33 @@ def get_dashboard_summary(
         subject_order = list(visible_subjects)
 
     week_daily_by_subject: list[dict] = []
-    for i in range(7):
-        dk = (week_start + timedelta(days=i)).isoformat()
-        m = week_hours_by_date_subject.get(dk, {})
-        subjects_map = {name: float(m.get(name, 0.0)) for name in subject_order}
+    for dk in week_keys:
+        m = week_ms_by_date_subject.get(dk, {})
+        subjects_map = {name: m.get(name, 0) / 3_600_000.0 for name in subject_order}
         week_daily_by_subject.append({"date_key": dk, "subjects": subjects_map})
 
-    # 2) ストリーク（直近N日）
-    if streak_days < 1:
-        streak_days = 1
-    streak_start = base_day - timedelta(days=streak_days - 1)
-    streak_start_key = streak_start.isoformat()
-    streak_end_key = (base_day + timedelta(days=1)).isoformat()
-
-    streak_rows = (
-        db.query(
-            models.StudyTimeSyncSession.date_key.label("date_key"),
-            func.sum(models.StudyTimeSyncSession.last_total_ms).label("total_ms"),
-        )
-        .filter(models.StudyTimeSyncSession.user_id == user_id)
-        .filter(models.StudyTimeSyncSession.date_key >= streak_start_key)
-        .filter(models.StudyTimeSyncSession.date_key < streak_end_key)
-        .group_by(models.StudyTimeSyncSession.date_key)
-        .all()
-    )
-    streak_hours_by_date = {r.date_key: float(r.total_ms or 0.0) / 3_600_000.0 for r in streak_rows}
+    # 2) ストリーク
+    streak_hours_by_date = {k: ms / 3_600_000.0 for k, ms in streak_ms_by_date.items()}
     active_dates = sorted([k for k, h in streak_hours_by_date.items() if h > 0.0])
     active_hours_by_date = {k: float(h) for k, h in streak_hours_by_date.items() if float(h) > 0.0}
 
-    # current streak（今日から遡る）
-    current = 0
-    cur = base_day
-    while cur >= streak_start:
-        k = cur.isoformat()
-        if float(streak_hours_by_date.get(k, 0.0)) > 0.0:
-            current += 1
-            cur = cur - timedelta(days=1)
-        else:
-            break
-
-    # longest streak（直近N日での最長）
+    # current / longest streak
+    # 学習した日（active_dates, 昇順）だけを1回走査し、連続する日付の並び（島）の長さを数える
+    # - longest: 直近N日での最長の島
+    # - current: 最後の島が今日で終わっていればその長さ（今日から遡った連続日数）
     longest = 0
     run = 0
-    d = streak_start
-    while d <= base_day:
-        k = d.isoformat()
-        if float(streak_hours_by_date.get(k, 0.0)) > 0.0:
-            run += 1
-            if run > longest:
-                longest = run
-        else:
-            run = 0
-        d = d + timedelta(days=1)
+    prev = None
+    for k in active_dates:
+        try:
+            d = _parse_date_key(k)
+        except ValueError:
+            continue
+        run = run + 1 if prev is not None and (d - prev).days == 1 else 1
+        prev = d
+        if run > longest:
+            longest = run
+    current = run if prev == base_day else 0
 
     subjects = get_subjects_summary(db, user_id=user_id)
 
@@ -359,64 +458,61 @@ def get_dashboard_summary(
 # Study time sync (timer)
 # ----------------------------
 
-def _date_key_to_range(date_key: str):
+_DATE_KEY_RE = re.compile(r"[0-9]{4}-[0-9]{2}-[0-9]{2}")
+
+@lru_cache(maxsize=4096)
+def _parse_date_key(date_key: str) -> date:
     """
-    yyyy-MM-dd の日付キーから、その日の [00:00, 24:00) の範囲を返す（ローカルタイム前提）
+    yyyy-MM-dd の日付キーを date にする。
+    - タイマー同期/集計のたびに同じキーが来るため、結果をキャッシュする
+    - strptime の書式解釈ではなく C 実装の fromisoformat を使う
+      （fromisoformat は "2026-W02-3" などの ISO 週日付も受け付けるため、先に形式を確認する）
     """
-    day = datetime.strptime(date_key, "%Y-%m-%d")
-    start = datetime(day.year, day.month, day.day, 0, 0, 0)
-    end = start + timedelta(days=1)
-    return start, end
-
-def _get_week_range(date_key: str):
+    if not _DATE_KEY_RE.fullmatch(date_key):
+        raise ValueError(f"invalid date_key: {date_key!r}")
+    return date.fromisoformat(date_key)
+
+# タイマー同期の初回 INSERT（既存行があれば何もしない）
+# - postgresql.insert(...).on_conflict_* は SQLAlchemy のSQLキャッシュ対象外で、呼ぶたびにコンパイルされる
+# - 同期は高頻度に呼ばれるため、キャッシュされる text() で持つ
+_STS_INSERT_IF_ABSENT_SQL = sa.text(
     """
-    週開始を月曜(ISO)として、基準日の週 [Mon 00:00, next Mon 00:00) を返す
+    INSERT INTO study_time_sync_sessions (user_id, date_key, subject, client_session_id, last_total_ms)
+    VALUES (:user_id, :date_key, :subject, :client_session_id, :total_ms)
+    ON CONFLICT ON CONSTRAINT uq_study_time_sync DO NOTHING
+    RETURNING id
     """
-    day = datetime.strptime(date_key, "%Y-%m-%d")
-    # Monday=0 ... Sunday=6
-    start = datetime(day.year, day.month, day.day, 0, 0, 0) - timedelta(days=day.weekday())
-    end = start + timedelta(days=7)
-    return start, end
+)
 
-def _get_or_create_daily_study_progress(db: Session, subject: str, date_key: str):
+def sync_study_time_total_ms(
+    db: Session,
+    user_id: str,
+    date_key: str,
+    subject: str,
+    client_session_id: str,
+    total_ms: int,
+):
     """
-    topic='学習時間' の日次レコードを、created_at の日付範囲で探してなければ作成する。
+    タイマー同期（/api/study-time/sync）: 累計の反映と今日/今週合計の取得を1トランザクションで行い、
+    (delta_ms, today_ms, week_ms) を返す。
+    - 合計は commit 前に同じトランザクションで読む（反映後の値になり、2つ目のトランザクションも不要）
+    - 同期のたびに DB へ書く（メモリにバッファしない）: プロセスが落ちても学習時間を失わず、合計も常にサーバ正のまま
     """
-    start, end = _date_key_to_range(date_key)
-    progress = (
-        db.query(models.StudyProgress)
-        .filter(models.StudyProgress.subject == subject)
-        .filter(models.StudyProgress.topic == "学習時間")
-        .filter(models.StudyProgress.created_at >= start)
-        .filter(models.StudyProgress.created_at < end)
-        .order_by(models.StudyProgress.created_at.desc())
-        .first()
-    )
-    if progress:
-        return progress
-
-    db_progress = models.StudyProgress(
-        subject=subject,
-        topic="学習時間",
-        progress_percent=0.0,
-        study_hours=0.0,
-        notes="(auto) timer sync",
-    )
-    db.add(db_progress)
+    delta_ms = _apply_study_time_total_ms(db, user_id, date_key, subject, client_session_id, total_ms)
+    today_ms, week_ms = get_study_time_summary_ms(db, user_id=user_id, date_key=date_key)
     db.commit()
-    db.refresh(db_progress)
-    return db_progress
+    return delta_ms, today_ms, week_ms
 
-def apply_study_time_total_ms(
+def _apply_study_time_total_ms(
     db: Session,
     user_id: str,
     date_key: str,
     subject: str,
     client_session_id: str,
     total_ms: int,
-):
+) -> int:
     """
-    クライアントから送られる累計(total_ms)を基に、差分(delta_ms)を返す（冪等）。
+    クライアントから送られる累計(total_ms)を基に、差分(delta_ms)を返す（冪等、commit は呼び出し側）。
 
     方針:
     - 学習時間の正は study_time_sync_sessions (last_total_ms) とする
@@ -425,35 +521,44 @@ def apply_study_time_total_ms(
     冪等性:
       同一 (user_id, date_key, subject, client_session_id) で last_total_ms を保持し、
       delta_ms = max(total_ms - last_total_ms, 0) のみを加算する。
+
+    タイマー同期で頻繁に呼ばれるため、往復は最大2文に抑える:
+    1) INSERT ... ON CONFLICT DO NOTHING RETURNING（初回はここで確定）
+    2) 既存行は FOR UPDATE でロックした旧値を基に、増えたときだけ UPDATE ... RETURNING
     """
-    sess = (
-        db.query(models.StudyTimeSyncSession)
-        .filter(models.StudyTimeSyncSession.user_id == user_id)
-        .filter(models.StudyTimeSyncSession.date_key == date_key)
-        .filter(models.StudyTimeSyncSession.subject == subject)
-        .filter(models.StudyTimeSyncSession.client_session_id == client_session_id)
-        .first()
+    total_ms = max(int(total_ms), 0)
+    sts = models.StudyTimeSyncSession
+    keys = (
+        (sts.user_id == user_id)
+        & (sts.date_key == date_key)
+        & (sts.subject == subject)
+        & (sts.client_session_id == client_session_id)
     )
-    if sess is None:
-        sess = models.StudyTimeSyncSession(
-            user_id=user_id,
-            date_key=date_key,
-            subject=subject,
-            client_session_id=client_session_id,
-            last_total_ms=0,
-        )
-        db.add(sess)
-        db.commit()
-        db.refresh(sess)
 
-    last_ms = int(sess.last_total_ms or 0)
-    delta_ms = max(int(total_ms) - last_ms, 0)
+    inserted = db.execute(
+        _STS_INSERT_IF_ABSENT_SQL,
+        {
+            "user_id": user_id,
+            "date_key": date_key,
+            "subject": subject,
+            "client_session_id": client_session_id,
+            "total_ms": total_ms,
+        },
+    ).first()
 
-    # 正は study_time_sync_sessions で管理する（StudyProgressへの加算は廃止）
-    if int(total_ms) > last_ms:
-        sess.last_total_ms = int(total_ms)
-        db.commit()
-        db.refresh(sess)
+    if inserted is not None:
+        delta_ms = total_ms
+    else:
+        prev = sa.select(sts.id, sts.last_total_ms).where(keys).with_for_update().subquery("prev")
+        last_ms = db.execute(
+            sa.update(sts)
+            .where(sts.id == prev.c.id)
+            .where(prev.c.last_total_ms < total_ms)
+            .values(last_total_ms=total_ms)
+            .returning(prev.c.last_total_ms)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+        delta_ms = 0 if last_ms is None else total_ms - int(last_ms)
 
     return int(delta_ms)
 
@@ -462,248 +567,371 @@ def get_study_time_summary_ms(db: Session, user_id: str, date_key: str):
     server(DB)を正として、study_time_sync_sessions から今日/今週の合計(ms)を返す。
     - date_key (yyyy-MM-dd) を日付基準として扱うため、UTC日付境界ズレを回避できる
     """
-    from sqlalchemy import func
-
-    # today
-    today_ms = (
-        db.query(func.sum(models.StudyTimeSyncSession.last_total_ms))
-        .filter(models.StudyTimeSyncSession.user_id == user_id)
-        .filter(models.StudyTimeSyncSession.date_key == date_key)
-        .scalar()
-    )
-
     # week (Mon..Sun) range on date_key strings
-    day = datetime.strptime(date_key, "%Y-%m-%d").date()
+    day = _parse_date_key(date_key)
     week_start = day - timedelta(days=day.weekday())
     week_end = week_start + timedelta(days=7)
     week_start_key = week_start.isoformat()
     week_end_key = week_end.isoformat()
 
-    week_ms = (
-        db.query(func.sum(models.StudyTimeSyncSession.last_total_ms))
-        .filter(models.StudyTimeSyncSession.user_id == user_id)
-        .filter(models.StudyTimeSyncSession.date_key >= week_start_key)
-        .filter(models.StudyTimeSyncSession.date_key < week_end_key)
-        .scalar()
-    )
+    # 今日は必ず今週に含まれるため、週の範囲を1回だけ走査して条件付き集計で両方を取る
+    sts = models.StudyTimeSyncSession
+    today_ms, week_ms = db.execute(
+        sa.select(
+            func.sum(sa.case((sts.date_key == date_key, sts.last_total_ms), else_=0)),
+            func.sum(sts.last_total_ms),
+        )
+        .where(sts.user_id == user_id)
+        .where(sts.date_key >= week_start_key)
+        .where(sts.date_key < week_end_key)
+    ).one()
 
     return int(today_ms or 0), int(week_ms or 0)
 
 # ToDo CRUD操作
 def get_todo(db: Session, todo_id: int):
     """IDでToDoを取得"""
-    return db.query(models.Todo).filter(models.Todo.id == todo_id).first()
+    return db.get(models.Todo, todo_id)
+
+# completed ASC（NULLS LAST）の並び
+_TODO_COMPLETED_ORDER = (False, True, None)
 
-def get_all_todos(db: Session, skip: int = 0, limit: int = 100):
-    """すべてのToDoを取得（未完了を先に、作成日時の降順）"""
-    return db.query(models.Todo).order_by(
-        models.Todo.completed.asc(),
-        models.Todo.created_at.desc()
-    ).offset(skip).limit(limit).all()
+def _todo_order(todo) -> tuple:
+    """get_all_todos の並び。ix_todos_completed_created_id (completed, created_at DESC, id DESC) と同じ"""
+    return (todo.completed.asc(), todo.created_at.desc(), todo.id.desc())
+
+def todo_cursor(todo: models.Todo) -> str:
+    """get_all_todos の次ページ用カーソル（todo はページ最後の行）"""
+    return _encode_cursor("todos", todo.completed, todo.created_at, todo.id)
+
+def parse_todo_cursor(cursor: str) -> tuple:
+    """todo_cursor を (completed, created_at, id) に戻す。不正なら ValueError"""
+    completed, created_at, last_id = _decode_cursor("todos", cursor, 3)
+    if completed is not None and not isinstance(completed, bool):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+    return completed, _cursor_datetime(created_at), _cursor_id(last_id)
+
+def _todo_ranges_after(after: tuple) -> list:
+    """
+    (completed, created_at, id) より後ろの ToDo を、completed ごとに区切った範囲の条件で返す。
+    各範囲は completed の等値 + (created_at, id) の範囲なので ix_todos_completed_created_id を範囲走査できる。
+    """
+    Todo = models.Todo
+    completed, created_at, last_id = after
+
+    def same(value):
+        return Todo.completed.is_(None) if value is None else Todo.completed == value
+
+    later = _TODO_COMPLETED_ORDER[_TODO_COMPLETED_ORDER.index(completed) + 1:]
+    return [
+        *(sa.and_(same(completed), r) for r in _seek_created_desc(Todo.created_at, Todo.id, created_at, last_id)),
+        *(same(value) for value in later),
+    ]
+
+def get_all_todos(db: Session, skip: int = 0, limit: int = 100, after: tuple | None = None):
+    """
+    すべてのToDoを取得（未完了を先に、作成日時の降順）
+    - after（parse_todo_cursor の結果）指定時は keyset ページング（OFFSET で読み捨てずに、その続きから limit 件）
+    """
+    if after is not None:
+        return _keyset_page(db, models.Todo, _todo_order, _todo_ranges_after(after), (), skip, limit)
+    q = _strict_loading(db.query(models.Todo))
+    return q.order_by(*_todo_order(models.Todo)).offset(skip).limit(limit).all()
 
 def create_todo(db: Session, todo: schemas.TodoCreate):
     """新しいToDoを作成"""
-    db_todo = models.Todo(
-        title=todo.title,
-        subject=todo.subject,
-        due_date=todo.due_date,
-        project_id=todo.project_id,
-        completed=False
-    )
+    db_todo = models.Todo(**_create_kwargs(todo, _TODO_CREATE_FIELDS), completed=False)
     db.add(db_todo)
+    # id / created_at は INSERT ... RETURNING で取得されるため refresh は不要
     db.commit()
-    db.refresh(db_todo)
     return db_todo
 
 def update_todo(db: Session, todo_id: int, todo_update: schemas.TodoUpdate):
     """ToDoを更新"""
-    db_todo = get_todo(db, todo_id)
-    if db_todo is None:
-        return None
-    
-    # Pydantic v2対応: model_dump()を使用
-    try:
-        if hasattr(todo_update, 'model_dump'):
-            # Pydantic v2
-            update_data = todo_update.model_dump(exclude_unset=True)
-            all_data = todo_update.model_dump(exclude_unset=False)
-            fields_set = getattr(todo_update, 'model_fields_set', set())
-        else:
-            # Pydantic v1
-            update_data = todo_update.dict(exclude_unset=True)
-            all_data = todo_update.dict(exclude_unset=False)
-            fields_set = getattr(todo_update, '__fields_set__', set())
-    except Exception as e:
-        logger.error(f"Error getting update data: {e}")
-        # フォールバック: dict()を使用
-        update_data = todo_update.dict(exclude_unset=True) if hasattr(todo_update, 'dict') else {}
-        all_data = todo_update.dict(exclude_unset=False) if hasattr(todo_update, 'dict') else {}
-        fields_set = set()
-    
-    logger.info(f"update_todo: todo_id={todo_id}, update_data before={update_data}, all_data={all_data}, fields_set={fields_set}, project_id in update_data={'project_id' in update_data}, project_id in all_data={'project_id' in all_data}, project_id in fields_set={'project_id' in fields_set}")
-    
-    # project_idがリクエストに明示的に含まれている場合のみ更新する
-    # fields_setに含まれている場合のみ、project_idがリクエストに含まれていることを意味する
-    # all_dataには、リクエストに含まれていないフィールドもNoneとして含まれるため、使用しない
-    if 'project_id' in fields_set:
-        # fields_setに含まれている場合は必ず更新（Noneでも）
-        update_data['project_id'] = todo_update.project_id
-        logger.info(f"Setting project_id from fields_set to: {todo_update.project_id}")
-    elif 'project_id' in update_data:
-        # update_dataに既に含まれている場合（exclude_unset=Trueでも含まれる場合）
-        # これは、リクエストにproject_idが含まれていることを意味する
-        logger.info(f"project_id already in update_data: {update_data['project_id']}")
-    # all_dataから取得する処理は削除（リクエストに含まれていないフィールドもNoneとして含まれるため）
-    
-    logger.info(f"update_todo: final update_data={update_data}")
-    
-    for field, value in update_data.items():
-        setattr(db_todo, field, value)
-    
+    update_data, fields_set = _dump_set(todo_update)
+
+    # project_id は「リクエストに明示的に含まれている場合のみ」更新する（None でも解除として反映）
+    # update_data は fields_set のキーだけを含むため、未指定の project_id は update_data に入らない
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "update_todo: todo_id=%s update_data=%s fields_set=%s",
+            todo_id,
+            update_data,
+            fields_set,
+        )
+
+    if not update_data:
+        return get_todo(db, todo_id)
+
+    # UPDATE ... RETURNING で存在確認・更新・再取得を1往復にまとめる
+    db_todo = db.execute(
+        sa.update(models.Todo)
+        .where(models.Todo.id == todo_id)
+        .values(**update_data)
+        .returning(models.Todo)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(db_todo)
-    logger.info(f"update_todo: after update, db_todo.project_id={db_todo.project_id}")
     return db_todo
 
 def delete_todo(db: Session, todo_id: int):
     """ToDoを削除"""
-    db_todo = get_todo(db, todo_id)
-    if db_todo is None:
-        return None
-    
-    db.delete(db_todo)
+    db_todo = db.execute(
+        sa.delete(models.Todo).where(models.Todo.id == todo_id).returning(models.Todo)
+    ).scalar_one_or_none()
     db.commit()
     return db_todo
 
 # 設定CRUD操作
+# 設定はプロセス内で TTL 付きでキャッシュする（読み取りがほとんどで、値も小さい）
+# - SETTINGS_CACHE_TTL 秒（既定 30、0 で無効）の間は DB を引かずに返す
+# - 最大 _SETTINGS_CACHE_MAXSIZE 件の LRU。存在しないキーの結果（None）はキャッシュしない
+#   （任意のキーを問い合わせてもメモリが増え続けないようにする）
+# - このプロセスからの書き込み（create_or_update_setting / update_subject_name）では commit 後に即座に破棄する
+# - 他プロセス/手作業での書き込みは最大 TTL 秒遅れて反映される（本番は uvicorn 1ワーカー）
+# - 値はセッションに属さない transient な Settings のコピーで持つ（スレッド間で共有しても expire / detach されない）
+_SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "30"))
+_SETTINGS_CACHE_MAXSIZE = 256
+_settings_cache: OrderedDict = OrderedDict()  # key（または _ALL_SETTINGS）-> (期限, 値)。古く使われた順
+_ALL_SETTINGS = object()
+# 破棄のたびに進める世代番号。読み込み中に書き込みがあった場合、古い値をキャッシュに入れない
+_settings_generation = 0
+# sync def のエンドポイントはスレッドプールで並行に動くため、キャッシュの参照・格納・破棄はロック下で行う
+# （DB の読み込み自体はロックの外）
+_settings_lock = threading.Lock()
+
+
+def _settings_snapshot(s: models.Settings | None) -> models.Settings | None:
+    if s is None:
+        return None
+    return models.Settings(id=s.id, key=s.key, value=s.value, created_at=s.created_at, updated_at=s.updated_at)
+
+
+def _cached_settings(cache_key, load):
+    """cache_key のキャッシュが有効ならそれを、無ければ load() の結果をキャッシュして返す"""
+    with _settings_lock:
+        hit = _settings_cache.get(cache_key)
+        if hit is not None:
+            if hit[0] > time.monotonic():
+                _settings_cache.move_to_end(cache_key)
+                return hit[1]
+            del _settings_cache[cache_key]
+        generation = _settings_generation
+    value = load()
+    if _SETTINGS_CACHE_TTL <= 0 or value is None:
+        return value
+    with _settings_lock:
+        # 読み込み中に破棄（書き込み）があった場合は、読んだ値が古い可能性があるため格納しない
+        if generation == _settings_generation:
+            _settings_cache[cache_key] = (time.monotonic() + _SETTINGS_CACHE_TTL, value)
+            _settings_cache.move_to_end(cache_key)
+            while len(_settings_cache) > _SETTINGS_CACHE_MAXSIZE:
+                _settings_cache.popitem(last=False)
+    return value
+
+
+def _invalidate_settings(key: str) -> None:
+    global _settings_generation
+    with _settings_lock:
+        _settings_generation += 1
+        _settings_cache.pop(key, None)
+        _settings_cache.pop(_ALL_SETTINGS, None)
+
+
 def get_setting(db: Session, key: str):
     """キーで設定を取得"""
-    return db.query(models.Settings).filter(models.Settings.key == key).first()
+    return _cached_settings(
+        key,
+        lambda: _settings_snapshot(
+            db.execute(sa.select(models.Settings).where(models.Settings.key == key)).scalar_one_or_none()
+        ),
+    )
 
 def get_all_settings(db: Session):
     """すべての設定を取得"""
-    return db.query(models.Settings).all()
+    return _cached_settings(
+        _ALL_SETTINGS,
+        lambda: [_settings_snapshot(s) for s in db.execute(sa.select(models.Settings)).scalars()],
+    )
 
 def create_or_update_setting(db: Session, key: str, value: str):
     """設定を作成または更新"""
-    setting = get_setting(db, key)
-    if setting:
-        setting.value = value
-        db.commit()
-        db.refresh(setting)
-        return setting
-    else:
-        db_setting = models.Settings(key=key, value=value)
-        db.add(db_setting)
-        db.commit()
-        db.refresh(db_setting)
-        return db_setting
+    # key の一意制約 (uq_settings_key) を使い、INSERT ... ON CONFLICT DO UPDATE RETURNING の1文で行う
+    stmt = pg_insert(models.Settings).values(key=key, value=value)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Settings.key],
+        set_={"value": stmt.excluded.value, "updated_at": func.now()},
+    ).returning(models.Settings)
+    setting = db.execute(stmt, execution_options={"populate_existing": True}).scalar_one()
+    db.commit()
+    _invalidate_settings(key)
+    return setting
+
+# settings.review_timing（[{subject_name, review_days}, ...]）内の subject_name を置換する
+# - 旧科目名を含む場合のみ更新（含まなければ行に触れない）
+# - 配列の順序は WITH ORDINALITY で維持する
+_RENAME_REVIEW_TIMING_SUBJECT_SQL = sa.text(
+    """
+    UPDATE settings
+    SET value = (
+            SELECT COALESCE(
+                jsonb_agg(
+                    CASE
+                        WHEN e.elem ->> 'subject_name' = :old
+                        THEN jsonb_set(e.elem, '{subject_name}', to_jsonb(CAST(:new AS text)))
+                        ELSE e.elem
+                    END
+                    ORDER BY e.ord
+                ),
+                '[]'::jsonb
+            )::text
+            FROM jsonb_array_elements(settings.value::jsonb) WITH ORDINALITY AS e(elem, ord)
+        ),
+        updated_at = now()
+    WHERE key = 'review_timing'
+      AND settings.value::jsonb @> jsonb_build_array(jsonb_build_object('subject_name', CAST(:old AS text)))
+    """
+)
+
 
 def update_subject_name(db: Session, old_name: str, new_name: str):
     """科目名を更新し、関連するToDo、StudyProgress、ReviewTimingも更新"""
-    # ToDoの科目名を更新
-    todos = db.query(models.Todo).filter(models.Todo.subject == old_name).all()
-    for todo in todos:
-        todo.subject = new_name
+    # ToDoの科目名を更新（行をロードせず1回のUPDATEで更新）
+    todo_count = (
+        db.query(models.Todo)
+        .filter(models.Todo.subject == old_name)
+        .update({models.Todo.subject: new_name}, synchronize_session=False)
+    )
     
     # StudyProgressの科目名を更新（VIEWだと書き込み不可になるため legacy テーブルへ）
     WriteModel = _study_progress_write_model(db)
-    progress_list = db.query(WriteModel).filter(WriteModel.subject == old_name).all()
-    for progress in progress_list:
-        progress.subject = new_name
+    progress_count = (
+        db.query(WriteModel)
+        .filter(WriteModel.subject == old_name)
+        .update({WriteModel.subject: new_name}, synchronize_session=False)
+    )
     
     # ReviewTiming設定の科目名を更新
-    import json
-    review_timing_setting = db.query(models.Settings).filter(models.Settings.key == 'review_timing').first()
-    if review_timing_setting:
-        try:
-            review_timings = json.loads(review_timing_setting.value)
-            if isinstance(review_timings, list):
-                updated = False
-                for timing in review_timings:
-                    if isinstance(timing, dict) and timing.get('subject_name') == old_name:
-                        timing['subject_name'] = new_name
-                        updated = True
-                if updated:
-                    review_timing_setting.value = json.dumps(review_timings)
-        except (json.JSONDecodeError, TypeError) as e:
-            print(f"Error parsing review_timing setting: {e}")
+    # settings.value(JSON文字列) を Python で読み書きせず、jsonb として DB 内で1文で書き換える
+    # （読み取り〜commit 間の lost update も起きない）
+    try:
+        with db.begin_nested():
+            db.execute(_RENAME_REVIEW_TIMING_SUBJECT_SQL, {"old": old_name, "new": new_name})
+    except sa.exc.DBAPIError as e:
+        # JSONとして不正な値が入っている場合はスキップ（ToDo/進捗の更新は継続）
+        logger.warning("review_timing の科目名更新に失敗しました: %s", e.orig)
     
     # Projectにはsubject属性がないため、更新不要
     
     db.commit()
-    return len(todos) + len(progress_list)
+    _invalidate_settings("review_timing")
+    return int(todo_count or 0) + int(progress_count or 0)
 
 # プロジェクトCRUD操作
 def get_project(db: Session, project_id: int):
     """IDでプロジェクトを取得"""
-    return db.query(models.Project).filter(models.Project.id == project_id).first()
-
-def get_all_projects(db: Session, skip: int = 0, limit: int = 100, include_completed: bool = False):
-    """すべてのプロジェクトを取得（期限日の昇順）"""
-    q = db.query(models.Project)
-    if not include_completed:
-        q = q.filter(models.Project.completed.is_(False))
-    return q.order_by(
-        models.Project.due_date.asc().nulls_last(),
-        models.Project.created_at.desc()
-    ).offset(skip).limit(limit).all()
+    return db.get(models.Project, project_id)
+
+def _project_order(project) -> tuple:
+    """get_all_projects の並び。ix_projects_due_created_id (due_date, created_at DESC, id DESC) と同じ"""
+    return (project.due_date.asc().nulls_last(), project.created_at.desc(), project.id.desc())
+
+def project_cursor(project: models.Project) -> str:
+    """get_all_projects の次ページ用カーソル（project はページ最後の行）"""
+    return _encode_cursor("projects", project.due_date, project.created_at, project.id)
+
+def parse_project_cursor(cursor: str) -> tuple:
+    """project_cursor を (due_date, created_at, id) に戻す。不正なら ValueError"""
+    due_date, created_at, last_id = _decode_cursor("projects", cursor, 3)
+    return _cursor_datetime(due_date), _cursor_datetime(created_at), _cursor_id(last_id)
+
+def _project_ranges_after(after: tuple) -> list:
+    """
+    (due_date, created_at, id) より後ろのプロジェクトを、ix_projects_due_created_id の範囲走査になる条件で返す。
+    """
+    Project = models.Project
+    due_date, created_at, last_id = after
+    seek = _seek_created_desc(Project.created_at, Project.id, created_at, last_id)
+    if due_date is None:
+        return [sa.and_(Project.due_date.is_(None), r) for r in seek]
+    return [
+        *(sa.and_(Project.due_date == due_date, r) for r in seek),
+        Project.due_date > due_date,
+        Project.due_date.is_(None),
+    ]
+
+def get_all_projects(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    include_completed: bool = False,
+    after: tuple | None = None,
+):
+    """
+    すべてのプロジェクトを取得（期限日の昇順）
+    - after（parse_project_cursor の結果）指定時は keyset ページング（その続きから limit 件）
+    """
+    where = () if include_completed else (models.Project.completed.is_(False),)
+    if after is not None:
+        return _keyset_page(db, models.Project, _project_order, _project_ranges_after(after), where, skip, limit)
+    q = _strict_loading(db.query(models.Project)).filter(*where)
+    return q.order_by(*_project_order(models.Project)).offset(skip).limit(limit).all()
 
 def create_project(db: Session, project: schemas.ProjectCreate):
     """新しいプロジェクトを作成"""
-    db_project = models.Project(**project.dict())
+    db_project = models.Project(**_create_kwargs(project, _PROJECT_CREATE_FIELDS))
     db.add(db_project)
     db.commit()
-    db.refresh(db_project)
     return db_project
 
 def update_project(db: Session, project_id: int, project_update: schemas.ProjectUpdate):
     """プロジェクトを更新"""
-    db_project = get_project(db, project_id)
-    if db_project is None:
-        return None
-    
-    update_data = project_update.dict(exclude_unset=True)
-    for field, value in update_data.items():
-        setattr(db_project, field, value)
-    
+    update_data = _dump_unset(project_update)
+    if not update_data:
+        return get_project(db, project_id)
+
+    # UPDATE ... RETURNING で存在確認・更新・再取得を1往復にまとめる
+    db_project = db.execute(
+        sa.update(models.Project)
+        .where(models.Project.id == project_id)
+        .values(**update_data)
+        .returning(models.Project)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(db_project)
     return db_project
 
 def delete_project(db: Session, project_id: int):
     """プロジェクトを削除（関連するToDoのproject_idをnullに設定）"""
-    db_project = get_project(db, project_id)
-    if db_project is None:
-        return None
-    
-    # 関連するToDoのproject_idをnullに設定
-    todos = db.query(models.Todo).filter(models.Todo.project_id == project_id).all()
-    for todo in todos:
-        todo.project_id = None
-    
-    db.delete(db_project)
+    # 関連するToDoのproject_idは外部キーの ON DELETE SET NULL で DB が NULL にする
+    db_project = db.execute(
+        sa.delete(models.Project).where(models.Project.id == project_id).returning(models.Project)
+    ).scalar_one_or_none()
     db.commit()
     return db_project
 
 def complete_project_and_todos(db: Session, project_id: int):
     """プロジェクトを完了し、紐づく未完了ToDoも一括で完了にする"""
-    db_project = get_project(db, project_id)
-    if db_project is None:
-        return None
-
     # 既に完了済みでも、未完了ToDoが残っていれば完了に揃える
-    db_project.completed = True
-
-    updated_todos = (
-        db.query(models.Todo)
-        .filter(models.Todo.project_id == project_id)
-        .filter(models.Todo.completed.is_(False))
-        .update({models.Todo.completed: True}, synchronize_session=False)
+    # ToDo側の UPDATE を data-modifying CTE にし、プロジェクトの UPDATE ... RETURNING と1文・1往復で実行する
+    completed_todos = (
+        sa.update(models.Todo)
+        .where(models.Todo.project_id == project_id)
+        .where(models.Todo.completed.is_(False))
+        .values(completed=True)
+        .returning(models.Todo.id)
+        .cte("completed_todos")
     )
-
+    updated_count = sa.select(func.count()).select_from(completed_todos).scalar_subquery()
+    row = db.execute(
+        sa.update(models.Project)
+        .where(models.Project.id == project_id)
+        .values(completed=True)
+        .returning(models.Project, updated_count)
+        .add_cte(completed_todos)
+    ).one_or_none()
     db.commit()
-    db.refresh(db_project)
+    if row is None:
+        return None
+    db_project, updated_todos = row
     return db_project, int(updated_todos or 0)
 
 # ----------------------------
@@ -715,12 +943,12 @@ def _review_set_tables_ready(db: Session) -> bool:
     マイグレーション未適用期間の後方互換:
     テーブルが存在しない場合は False を返し、呼び出し側が旧ロジックにフォールバックできるようにする。
     """
-    try:
-        bind = db.get_bind()
-        insp = sa.inspect(bind)
-        return insp.has_table("review_set_lists") and insp.has_table("review_set_items")
-    except Exception:
-        return False
+    return _has_table(db, "review_set_lists") and _has_table(db, "review_set_items")
+
+
+def _any_review_set_lists(db: Session) -> bool:
+    """review_set_lists に1行でもあるか（COUNT(*) で全件数えず、EXISTS で最初の1行で止める）"""
+    return bool(db.scalar(sa.select(sa.exists().select_from(models.ReviewSetList))))
 
 
 def _seed_review_set_lists_from_legacy_settings(db: Session) -> int:
@@ -733,14 +961,12 @@ def _seed_review_set_lists_from_legacy_settings(db: Session) -> int:
         return 0
 
     try:
-        existing_count = db.query(models.ReviewSetList).count()
+        if _any_review_set_lists(db):
+            return 0
     except ProgrammingError:
         return 0
 
-    if existing_count > 0:
-        return 0
-
-    setting = db.query(models.Settings).filter(models.Settings.key == "review_timing").first()
+    setting = get_setting(db, "review_timing")
     if not setting:
         return 0
 
@@ -753,7 +979,8 @@ def _seed_review_set_lists_from_legacy_settings(db: Session) -> int:
     if not isinstance(parsed, list):
         return 0
 
-    created = 0
+    # items はリレーション経由で持たせ、flush 時にリスト・アイテムそれぞれ1回の INSERT（executemany）でまとめて投入する
+    set_lists = []
     for timing in parsed:
         if not isinstance(timing, dict):
             continue
@@ -762,22 +989,19 @@ def _seed_review_set_lists_from_legacy_settings(db: Session) -> int:
         if not subject_name or not isinstance(review_days, list) or len(review_days) == 0:
             continue
 
-        name = f"{subject_name}（旧）"
-
-        rs = models.ReviewSetList(name=name)
-        db.add(rs)
-        db.flush()  # id を確定
-
+        items = []
         for day in review_days:
             try:
                 offset = int(day)
             except Exception:
                 continue
-            db.add(models.ReviewSetItem(set_list_id=rs.id, offset_days=offset))
+            items.append(models.ReviewSetItem(offset_days=offset))
 
-        created += 1
+        set_lists.append(models.ReviewSetList(name=f"{subject_name}（旧）", items=items))
 
+    created = len(set_lists)
     if created > 0:
+        db.add_all(set_lists)
         db.commit()
         logger.info(f"[ReviewSet] 旧review_timingから復習セットを{created}件生成しました（必要に応じて名称を変更してください）")
     return created
@@ -792,7 +1016,7 @@ def get_all_review_set_lists(db: Session, skip: int = 0, limit: int = 100):
     # - 旧 settings.review_timing を使うかどうかは settings.use_legacy_review_sets で制御する
     # - use_legacy_review_sets=false の場合、review_set_lists が 0 件でも旧データから復活させない
     try:
-        if db.query(models.ReviewSetList).count() == 0:
+        if not _any_review_set_lists(db):
             use_legacy = _get_bool_setting(db, "use_legacy_review_sets", True)
             if use_legacy:
                 _seed_review_set_lists_from_legacy_settings(db)
@@ -800,7 +1024,7 @@ def get_all_review_set_lists(db: Session, skip: int = 0, limit: int = 100):
         return []
 
     return (
-        db.query(models.ReviewSetList)
+        _strict_loading(db.query(models.ReviewSetList), selectinload(models.ReviewSetList.items))
         .order_by(models.ReviewSetList.created_at.desc().nullslast(), models.ReviewSetList.id.desc())
         .offset(skip)
         .limit(limit)
@@ -811,22 +1035,20 @@ def get_all_review_set_lists(db: Session, skip: int = 0, limit: int = 100):
 def get_review_set_list(db: Session, set_list_id: int):
     if not _review_set_tables_ready(db):
         raise RuntimeError("review_set_lists tables are not ready (migration not applied)")
-    return db.query(models.ReviewSetList).filter(models.ReviewSetList.id == set_list_id).first()
+    return db.get(models.ReviewSetList, set_list_id)
 
 
 def create_review_set_list(db: Session, payload: schemas.ReviewSetListCreate):
     if not _review_set_tables_ready(db):
         raise RuntimeError("review_set_lists tables are not ready (migration not applied)")
 
-    rs = models.ReviewSetList(name=payload.name)
+    # items はリレーション経由で追加し、commit 後もそのままレスポンスに使えるようにする
+    rs = models.ReviewSetList(
+        name=payload.name,
+        items=[models.ReviewSetItem(offset_days=int(item.offset_days)) for item in payload.items or []],
+    )
     db.add(rs)
-    db.flush()
-
-    for item in payload.items or []:
-        db.add(models.ReviewSetItem(set_list_id=rs.id, offset_days=int(item.offset_days)))
-
     db.commit()
-    db.refresh(rs)
     # 新運用へ移行したので、旧セットへのフォールバックは以後禁止
     try:
         create_or_update_setting(db, "use_legacy_review_sets", "false")
@@ -836,14 +1058,20 @@ def create_review_set_list(db: Session, payload: schemas.ReviewSetListCreate):
 
 
 def update_review_set_list(db: Session, set_list_id: int, payload: schemas.ReviewSetListUpdate):
-    rs = get_review_set_list(db, set_list_id)
-    if rs is None:
-        return None
-    data = payload.dict(exclude_unset=True)
-    for k, v in data.items():
-        setattr(rs, k, v)
+    data = _dump_unset(payload)
+    if not data:
+        return get_review_set_list(db, set_list_id)
+    if not _review_set_tables_ready(db):
+        raise RuntimeError("review_set_lists tables are not ready (migration not applied)")
+
+    # UPDATE ... RETURNING で存在確認・更新・再取得を1往復にまとめる（items は selectin でロードされる）
+    rs = db.execute(
+        sa.update(models.ReviewSetList)
+        .where(models.ReviewSetList.id == set_list_id)
+        .values(**data)
+        .returning(models.ReviewSetList)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(rs)
     return rs
 
 
@@ -855,7 +1083,7 @@ def delete_review_set_list(db: Session, set_list_id: int):
     db.commit()
     # 全削除されたら、旧セットへのフォールバックも無効化（復活防止）
     try:
-        if db.query(models.ReviewSetList).count() == 0:
+        if not _any_review_set_lists(db):
             create_or_update_setting(db, "use_legacy_review_sets", "false")
     except Exception:
         pass
@@ -868,26 +1096,26 @@ def create_review_set_item(db: Session, set_list_id: int, payload: schemas.Revie
     item = models.ReviewSetItem(set_list_id=set_list_id, offset_days=int(payload.offset_days))
     db.add(item)
     db.commit()
-    db.refresh(item)
     return item
 
 
 def update_review_set_item(db: Session, item_id: int, offset_days: int):
     if not _review_set_tables_ready(db):
         raise RuntimeError("review_set_lists tables are not ready (migration not applied)")
-    item = db.query(models.ReviewSetItem).filter(models.ReviewSetItem.id == item_id).first()
-    if item is None:
-        return None
-    item.offset_days = int(offset_days)
+    item = db.execute(
+        sa.update(models.ReviewSetItem)
+        .where(models.ReviewSetItem.id == item_id)
+        .values(offset_days=int(offset_days))
+        .returning(models.ReviewSetItem)
+    ).scalar_one_or_none()
     db.commit()
-    db.refresh(item)
     return item
 
 
 def delete_review_set_item(db: Session, item_id: int):
     if not _review_set_tables_ready(db):
         raise RuntimeError("review_set_lists tables are not ready (migration not applied)")
-    item = db.query(models.ReviewSetItem).filter(models.ReviewSetItem.id == item_id).first()
+    item = db.get(models.ReviewSetItem, item_id)
     if item is None:
         return None
     db.delete(item)
@@ -922,30 +1150,27 @@ def generate_todos_from_review_set(
 
     title_base = (base_title or rs.name or "復習").strip() or "復習"
 
-    items = (
-        db.query(models.ReviewSetItem)
-        .filter(models.ReviewSetItem.set_list_id == rs.id)
-        .order_by(models.ReviewSetItem.id.asc())
-        .all()
-    )
+    # items は ReviewSetList.items（selectin, id 順）で取得済みのため再クエリしない
+    items = rs.items
     if not items:
         raise ValueError("set_list has no items")
 
-    created = []
-    for idx, item in enumerate(items):
-        due = base + timedelta(days=int(item.offset_days))
-        todo = models.Todo(
-            title=f"{title_base}_復習{idx + 1}回目",
-            subject=subject.strip(),
-            due_date=due,
-            project_id=project_id,
-            completed=False,
-        )
-        db.add(todo)
-        created.append(todo)
-
+    subject = subject.strip()
+    rows = [
+        {
+            "title": f"{title_base}_復習{idx + 1}回目",
+            "subject": subject,
+            "due_date": base + timedelta(days=int(item.offset_days)),
+            "project_id": project_id,
+            "completed": False,
+        }
+        for idx, item in enumerate(items)
+    ]
+    # 全件を1回の INSERT ... RETURNING で投入する（返却順は rows の順に揃える）
+    created = db.scalars(
+        sa.insert(models.Todo).returning(models.Todo, sort_by_parameter_order=True),
+        rows,
+    ).all()
     db.commit()
-    for t in created:
-        db.refresh(t)
     return created
 
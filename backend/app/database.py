@@ -1,7 +1,9 @@
 import os
 import logging
+from contextvars import ContextVar
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -11,8 +13,6 @@ logger = logging.getLogger(__name__)
 def _mask_database_url(url: str) -> str:
     # パスワードをログに出さない
     try:
-        from sqlalchemy.engine.url import make_url
-
         u = make_url(url)
         if u.password:
             u = u.set(password="***")
@@ -33,12 +33,49 @@ if not logging.getLogger().handlers:
 logger.info(f"[DB] DATABASE_URL={_mask_database_url(SQLALCHEMY_DATABASE_URL)}")
 
 # エンジン設定（PostgreSQL想定）
+# executemany（複数行INSERT/UPDATE）は1行ずつではなく 1000 行単位でまとめて送る
+_engine_kwargs: dict = {"insertmanyvalues_page_size": 1000}
+if make_url(SQLALCHEMY_DATABASE_URL).get_driver_name() == "psycopg2":
+    _engine_kwargs.update(executemany_mode="values_plus_batch", executemany_batch_page_size=1000)
+
+# コネクションプール（QueuePool）
+# - 同時リクエスト分の接続を使い回し、リクエストごとの接続確立（認証含む）を避ける
+# - pool_recycle: サーバ/経路側のアイドル切断より前に接続を作り直す
+# - pool_timeout: 接続が空かないときに待つ秒数（超えたら TimeoutError で 500 にし、無限に待たない）
+# - 値は環境変数で上書きできる（DB側の max_connections に合わせて調整する）
+_engine_kwargs.update(
+    pool_size=int(os.getenv("DB_POOL_SIZE", "10")),
+    max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    pool_timeout=int(os.getenv("DB_POOL_TIMEOUT", "30")),
+)
+
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
     pool_pre_ping=True,
+    **_engine_kwargs,
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# 開発/検証用: QUERY_COUNT_WARN (>0) を設定すると、リクエストごとの SQL 発行数を数える
+# - カウンタはミドルウェア（main.py）がリクエスト開始時に [0] をセットする
+# - スレッドプールで動く同期エンドポイントにもコンテキストがコピーされるため、list を共有して加算する
+QUERY_COUNT_WARN = int(os.getenv("QUERY_COUNT_WARN", "0"))
+query_counter: ContextVar[list[int] | None] = ContextVar("query_counter", default=None)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+if QUERY_COUNT_WARN > 0:
+    event.listen(engine, "before_cursor_execute", _count_query)
+
+# expire_on_commit=False:
+# commit 後にレスポンス生成で属性へ触れるたびに SELECT し直さないようにする
+# （server_default の列は INSERT ... RETURNING で取得済み）
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 Base = declarative_base()
 
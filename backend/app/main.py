@@ -1,10 +1,10 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session
 from typing import List, Optional
 import logging
 
-from .database import get_db
+from .database import get_db, QUERY_COUNT_WARN, query_counter
 from . import models, schemas, crud
 
 # ロギング設定
@@ -17,13 +17,36 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# 開発/検証用: リクエストごとの SQL 発行数（N+1 の検出）
+# QUERY_COUNT_WARN を超えたら警告ログを出し、常に X-Query-Count ヘッダで件数を返す
+if QUERY_COUNT_WARN > 0:
+    @app.middleware("http")
+    async def count_queries(request: Request, call_next):
+        counter = [0]
+        token = query_counter.set(counter)
+        try:
+            response = await call_next(request)
+        finally:
+            query_counter.reset(token)
+        response.headers["X-Query-Count"] = str(counter[0])
+        if counter[0] > QUERY_COUNT_WARN:
+            logger.warning(
+                "query count over threshold: %s %s queries=%d (threshold=%d)",
+                request.method,
+                request.url.path,
+                counter[0],
+                QUERY_COUNT_WARN,
+            )
+        return response
+
 # CORS設定
 app.add_middleware(
     CORSMiddleware,
     # - 本番: homepi / homepi.local からのアクセスを許可（Tailscale/MagicDNS と LAN 両対応）
     # - 開発: localhost:5173 を許可
     # - Docker内: frontend サービスからのアクセスも許可（既存挙動維持）
-    allow_origins=[
+    # - Origin の照合は `origin in allow_origins` なので、set にして定数時間で引く
+    allow_origins=frozenset([
         "http://homepi:5173",
         "http://homepi.local:5173",
         "http://localhost:5173",
@@ -33,12 +56,28 @@ app.add_middleware(
         "http://homepi.local",
         # docker compose 内部
         "http://frontend:5173",
-    ],
+    ]),
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 一覧の keyset ページング用カーソルをブラウザから読めるようにする
+    expose_headers=["X-Next-Cursor"],
 )
 
+def _parse_cursor(parse, cursor: Optional[str]):
+    """一覧の cursor クエリを crud の並びキーにする（不正・別の一覧のカーソルは 400）"""
+    if cursor is None:
+        return None
+    try:
+        return parse(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+def _set_next_cursor(response: Response, rows: list, limit: int, make_cursor) -> None:
+    """1ページ分埋まったときだけ、最後の行から次ページのカーソルを X-Next-Cursor ヘッダで返す"""
+    if rows and len(rows) >= limit:
+        response.headers["X-Next-Cursor"] = make_cursor(rows[-1])
+
 @app.get("/")
 async def root():
     return {"message": "CPA Dashboard API"}
@@ -47,12 +86,16 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+# NOTE: DB を使うエンドポイントは同期 def にする
+# - crud は同期 Session（psycopg2）でブロッキング I/O を行うため、async def から呼ぶとイベントループ全体が止まる
+# - def にすると FastAPI がスレッドプールで実行するので、DB 待ちの間も他のリクエストを処理できる
+
 # ----------------------------
 # Study time sync (timer)
 # ----------------------------
 
 @app.post("/api/study-time/sync", response_model=schemas.StudyTimeSyncResponse)
-async def sync_study_time(payload: schemas.StudyTimeSyncRequest, db: Session = Depends(get_db)):
+def sync_study_time(payload: schemas.StudyTimeSyncRequest, db: Session = Depends(get_db)):
     """
     タイマーの学習時間をサーバへ同期する（冪等）
 
@@ -64,7 +107,7 @@ async def sync_study_time(payload: schemas.StudyTimeSyncRequest, db: Session = D
     if not payload.client_session_id:
         raise HTTPException(status_code=400, detail="client_session_id is required")
 
-    applied_delta_ms = crud.apply_study_time_total_ms(
+    applied_delta_ms, today_ms, week_ms = crud.sync_study_time_total_ms(
         db,
         user_id=payload.user_id or "default",
         date_key=payload.date_key,
@@ -72,11 +115,10 @@ async def sync_study_time(payload: schemas.StudyTimeSyncRequest, db: Session = D
         client_session_id=payload.client_session_id,
         total_ms=payload.total_ms,
     )
-    today_ms, week_ms = crud.get_study_time_summary_ms(db, user_id=payload.user_id or "default", date_key=payload.date_key)
     return schemas.StudyTimeSyncResponse(applied_delta_ms=applied_delta_ms, server_today_total_ms=today_ms, server_week_total_ms=week_ms)
 
 @app.get("/api/study-time/summary", response_model=schemas.StudyTimeSummaryResponse)
-async def get_study_time_summary(
+def get_study_time_summary(
     date_key: str,
     user_id: str = "default",
     db: Session = Depends(get_db),
@@ -89,12 +131,17 @@ async def get_study_time_summary(
 
 # 勉強進捗のCRUDエンドポイント
 @app.get("/api/progress", response_model=List[schemas.StudyProgressResponse])
-async def get_all_progress(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """すべての勉強進捗を取得"""
-    return crud.get_all_study_progress(db, skip=skip, limit=limit)
+def get_all_progress(
+    skip: int = 0,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    """すべての勉強進捗を取得（after_id: 前ページ最後のID。指定時は keyset ページング）"""
+    return crud.get_all_study_progress(db, skip=skip, limit=limit, after_id=after_id)
 
 @app.get("/api/progress/{progress_id}", response_model=schemas.StudyProgressResponse)
-async def get_progress(progress_id: int, db: Session = Depends(get_db)):
+def get_progress(progress_id: int, db: Session = Depends(get_db)):
     """IDで進捗を取得"""
     progress = crud.get_study_progress(db, progress_id)
     if progress is None:
@@ -102,12 +149,12 @@ async def get_progress(progress_id: int, db: Session = Depends(get_db)):
     return progress
 
 @app.post("/api/progress", response_model=schemas.StudyProgressResponse, status_code=201)
-async def create_progress(progress: schemas.StudyProgressCreate, db: Session = Depends(get_db)):
+def create_progress(progress: schemas.StudyProgressCreate, db: Session = Depends(get_db)):
     """新しい進捗を作成"""
     return crud.create_study_progress(db, progress)
 
 @app.put("/api/progress/{progress_id}", response_model=schemas.StudyProgressResponse)
-async def update_progress(
+def update_progress(
     progress_id: int,
     progress_update: schemas.StudyProgressUpdate,
     db: Session = Depends(get_db)
@@ -119,7 +166,7 @@ async def update_progress(
     return progress
 
 @app.delete("/api/progress/{progress_id}", status_code=204)
-async def delete_progress(progress_id: int, db: Session = Depends(get_db)):
+def delete_progress(progress_id: int, db: Session = Depends(get_db)):
     """進捗を削除"""
     progress = crud.delete_study_progress(db, progress_id)
     if progress is None:
@@ -127,12 +174,12 @@ async def delete_progress(progress_id: int, db: Session = Depends(get_db)):
     return None
 
 @app.get("/api/progress/subject/{subject}", response_model=List[schemas.StudyProgressResponse])
-async def get_progress_by_subject(subject: str, db: Session = Depends(get_db)):
+def get_progress_by_subject(subject: str, db: Session = Depends(get_db)):
     """科目で進捗を取得"""
     return crud.get_study_progress_by_subject(db, subject)
 
 @app.get("/api/summary", response_model=schemas.DashboardSummaryResponse)
-async def get_summary(
+def get_summary(
     user_id: str = "default",
     date_key: Optional[str] = None,
     db: Session = Depends(get_db),
@@ -148,12 +195,21 @@ async def get_summary(
 
 # ToDoのCRUDエンドポイント
 @app.get("/api/todos", response_model=List[schemas.TodoResponse])
-async def get_all_todos(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """すべてのToDoを取得"""
-    return crud.get_all_todos(db, skip=skip, limit=limit)
+def get_all_todos(
+    response: Response,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """すべてのToDoを取得（cursor: 前ページの X-Next-Cursor。指定時は keyset ページング）"""
+    after = _parse_cursor(crud.parse_todo_cursor, cursor)
+    todos = crud.get_all_todos(db, skip=skip, limit=limit, after=after)
+    _set_next_cursor(response, todos, limit, crud.todo_cursor)
+    return todos
 
 @app.get("/api/todos/{todo_id}", response_model=schemas.TodoResponse)
-async def get_todo(todo_id: int, db: Session = Depends(get_db)):
+def get_todo(todo_id: int, db: Session = Depends(get_db)):
     """IDでToDoを取得"""
     todo = crud.get_todo(db, todo_id)
     if todo is None:
@@ -161,38 +217,25 @@ async def get_todo(todo_id: int, db: Session = Depends(get_db)):
     return todo
 
 @app.post("/api/todos", response_model=schemas.TodoResponse, status_code=201)
-async def create_todo(todo: schemas.TodoCreate, db: Session = Depends(get_db)):
+def create_todo(todo: schemas.TodoCreate, db: Session = Depends(get_db)):
     """新しいToDoを作成"""
     return crud.create_todo(db, todo)
 
 @app.put("/api/todos/{todo_id}", response_model=schemas.TodoResponse)
-async def update_todo(
+def update_todo(
     todo_id: int,
     todo_update: schemas.TodoUpdate,
     db: Session = Depends(get_db)
 ):
     """ToDoを更新"""
-    # デバッグ: リクエストボディの内容をログ出力
-    try:
-        # Pydantic v2対応
-        if hasattr(todo_update, 'model_dump'):
-            all_data = todo_update.model_dump(exclude_unset=False)
-            fields_set = getattr(todo_update, 'model_fields_set', set())
-        else:
-            all_data = todo_update.dict(exclude_unset=False)
-            fields_set = getattr(todo_update, '__fields_set__', set())
-        
-        logger.info(f"Update todo {todo_id}: all_data={all_data}, fields_set={fields_set}, project_id in all_data={'project_id' in all_data}, project_id in fields_set={'project_id' in fields_set}, project_id value={all_data.get('project_id')}")
-    except Exception as e:
-        logger.error(f"Error logging update request: {e}")
-    
+    # 受け取った内容のデバッグログは crud.update_todo 側で DEBUG レベル時のみ出力する
     todo = crud.update_todo(db, todo_id, todo_update)
     if todo is None:
         raise HTTPException(status_code=404, detail="ToDoが見つかりません")
     return todo
 
 @app.delete("/api/todos/{todo_id}", status_code=204)
-async def delete_todo(todo_id: int, db: Session = Depends(get_db)):
+def delete_todo(todo_id: int, db: Session = Depends(get_db)):
     """ToDoを削除"""
     todo = crud.delete_todo(db, todo_id)
     if todo is None:
@@ -201,12 +244,12 @@ async def delete_todo(todo_id: int, db: Session = Depends(get_db)):
 
 # 設定のエンドポイント
 @app.get("/api/settings", response_model=List[schemas.SettingsResponse])
-async def get_all_settings(db: Session = Depends(get_db)):
+def get_all_settings(db: Session = Depends(get_db)):
     """すべての設定を取得"""
     return crud.get_all_settings(db)
 
 @app.get("/api/settings/{key}", response_model=schemas.SettingsResponse)
-async def get_setting(key: str, db: Session = Depends(get_db)):
+def get_setting(key: str, db: Session = Depends(get_db)):
     """キーで設定を取得"""
     setting = crud.get_setting(db, key)
     if setting is None:
@@ -214,7 +257,7 @@ async def get_setting(key: str, db: Session = Depends(get_db)):
     return setting
 
 @app.post("/api/settings", response_model=schemas.SettingsResponse, status_code=201)
-async def create_or_update_setting(
+def create_or_update_setting(
     setting_data: schemas.SettingsCreate,
     db: Session = Depends(get_db)
 ):
@@ -222,7 +265,7 @@ async def create_or_update_setting(
     return crud.create_or_update_setting(db, setting_data.key, setting_data.value)
 
 @app.put("/api/subjects/update-name", response_model=schemas.SubjectUpdateResponse)
-async def update_subject_name(
+def update_subject_name(
     request: schemas.SubjectUpdateRequest,
     db: Session = Depends(get_db)
 ):
@@ -232,17 +275,24 @@ async def update_subject_name(
 
 # プロジェクトのCRUDエンドポイント
 @app.get("/api/projects", response_model=List[schemas.ProjectResponse])
-async def get_all_projects(
+def get_all_projects(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     include_completed: bool = False,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    """すべてのプロジェクトを取得"""
-    return crud.get_all_projects(db, skip=skip, limit=limit, include_completed=include_completed)
+    """すべてのプロジェクトを取得（cursor: 前ページの X-Next-Cursor。指定時は keyset ページング）"""
+    after = _parse_cursor(crud.parse_project_cursor, cursor)
+    projects = crud.get_all_projects(
+        db, skip=skip, limit=limit, include_completed=include_completed, after=after
+    )
+    _set_next_cursor(response, projects, limit, crud.project_cursor)
+    return projects
 
 @app.get("/api/projects/{project_id}", response_model=schemas.ProjectResponse)
-async def get_project(project_id: int, db: Session = Depends(get_db)):
+def get_project(project_id: int, db: Session = Depends(get_db)):
     """IDでプロジェクトを取得"""
     project = crud.get_project(db, project_id)
     if project is None:
@@ -250,12 +300,12 @@ async def get_project(project_id: int, db: Session = Depends(get_db)):
     return project
 
 @app.post("/api/projects", response_model=schemas.ProjectResponse, status_code=201)
-async def create_project(project: schemas.ProjectCreate, db: Session = Depends(get_db)):
+def create_project(project: schemas.ProjectCreate, db: Session = Depends(get_db)):
     """新しいプロジェクトを作成"""
     return crud.create_project(db, project)
 
 @app.put("/api/projects/{project_id}", response_model=schemas.ProjectResponse)
-async def update_project(
+def update_project(
     project_id: int,
     project_update: schemas.ProjectUpdate,
     db: Session = Depends(get_db)
@@ -267,7 +317,7 @@ async def update_project(
     return project
 
 @app.delete("/api/projects/{project_id}", status_code=204)
-async def delete_project(project_id: int, db: Session = Depends(get_db)):
+def delete_project(project_id: int, db: Session = Depends(get_db)):
     """プロジェクトを削除"""
     project = crud.delete_project(db, project_id)
     if project is None:
@@ -275,7 +325,7 @@ async def delete_project(project_id: int, db: Session = Depends(get_db)):
     return None
 
 @app.post("/api/projects/{project_id}/complete", response_model=schemas.ProjectCompleteResponse)
-async def complete_project(project_id: int, db: Session = Depends(get_db)):
+def complete_project(project_id: int, db: Session = Depends(get_db)):
     """プロジェクトを完了し、紐づく未完了ToDoを一括で完了にする"""
     result = crud.complete_project_and_todos(db, project_id)
     if result is None:
@@ -288,7 +338,7 @@ async def complete_project(project_id: int, db: Session = Depends(get_db)):
 # ----------------------------
 
 @app.get("/api/review-set-lists", response_model=List[schemas.ReviewSetListResponse])
-async def get_review_set_lists(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+def get_review_set_lists(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     """復習セットリスト一覧を取得（空の場合は旧review_timingから自動生成して返す）"""
     try:
         return crud.get_all_review_set_lists(db, skip=skip, limit=limit)
@@ -298,7 +348,7 @@ async def get_review_set_lists(skip: int = 0, limit: int = 100, db: Session = De
 
 
 @app.get("/api/review-set-lists/{set_list_id}", response_model=schemas.ReviewSetListResponse)
-async def get_review_set_list(set_list_id: int, db: Session = Depends(get_db)):
+def get_review_set_list(set_list_id: int, db: Session = Depends(get_db)):
     try:
         rs = crud.get_review_set_list(db, set_list_id)
     except RuntimeError as e:
@@ -309,7 +359,7 @@ async def get_review_set_list(set_list_id: int, db: Session = Depends(get_db)):
 
 
 @app.post("/api/review-set-lists", response_model=schemas.ReviewSetListResponse, status_code=201)
-async def create_review_set_list(payload: schemas.ReviewSetListCreate, db: Session = Depends(get_db)):
+def create_review_set_list(payload: schemas.ReviewSetListCreate, db: Session = Depends(get_db)):
     try:
         return crud.create_review_set_list(db, payload)
     except RuntimeError as e:
@@ -317,7 +367,7 @@ async def create_review_set_list(payload: schemas.ReviewSetListCreate, db: Sessi
 
 
 @app.put("/api/review-set-lists/{set_list_id}", response_model=schemas.ReviewSetListResponse)
-async def update_review_set_list(set_list_id: int, payload: schemas.ReviewSetListUpdate, db: Session = Depends(get_db)):
+def update_review_set_list(set_list_id: int, payload: schemas.ReviewSetListUpdate, db: Session = Depends(get_db)):
     rs = crud.update_review_set_list(db, set_list_id, payload)
     if rs is None:
         raise HTTPException(status_code=404, detail="セットリストが見つかりません")
@@ -325,7 +375,7 @@ async def update_review_set_list(set_list_id: int, payload: schemas.ReviewSetLis
 
 
 @app.delete("/api/review-set-lists/{set_list_id}", status_code=204)
-async def delete_review_set_list(set_list_id: int, db: Session = Depends(get_db)):
+def delete_review_set_list(set_list_id: int, db: Session = Depends(get_db)):
     rs = crud.delete_review_set_list(db, set_list_id)
     if rs is None:
         raise HTTPException(status_code=404, detail="セットリストが見つかりません")
@@ -333,7 +383,7 @@ async def delete_review_set_list(set_list_id: int, db: Session = Depends(get_db)
 
 
 @app.post("/api/review-set-lists/{set_list_id}/items", response_model=schemas.ReviewSetItemResponse, status_code=201)
-async def create_review_set_item(set_list_id: int, payload: schemas.ReviewSetItemCreate, db: Session = Depends(get_db)):
+def create_review_set_item(set_list_id: int, payload: schemas.ReviewSetItemCreate, db: Session = Depends(get_db)):
     try:
         item = crud.create_review_set_item(db, set_list_id, payload)
     except RuntimeError as e:
@@ -344,7 +394,7 @@ async def create_review_set_item(set_list_id: int, payload: schemas.ReviewSetIte
 
 
 @app.put("/api/review-set-items/{item_id}", response_model=schemas.ReviewSetItemResponse)
-async def update_review_set_item(item_id: int, payload: schemas.ReviewSetItemCreate, db: Session = Depends(get_db)):
+def update_review_set_item(item_id: int, payload: schemas.ReviewSetItemCreate, db: Session = Depends(get_db)):
     try:
         item = crud.update_review_set_item(db, item_id, payload.offset_days)
     except RuntimeError as e:
@@ -355,7 +405,7 @@ async def update_review_set_item(item_id: int, payload: schemas.ReviewSetItemCre
 
 
 @app.delete("/api/review-set-items/{item_id}", status_code=204)
-async def delete_review_set_item(item_id: int, db: Session = Depends(get_db)):
+def delete_review_set_item(item_id: int, db: Session = Depends(get_db)):
     try:
         item = crud.delete_review_set_item(db, item_id)
     except RuntimeError as e:
@@ -366,7 +416,7 @@ async def delete_review_set_item(item_id: int, db: Session = Depends(get_db)):
 
 
 @app.post("/api/review-set-lists/generate", response_model=schemas.ReviewSetGenerateResponse, status_code=201)
-async def generate_review_set(payload: schemas.ReviewSetGenerateRequest, db: Session = Depends(get_db)):
+def generate_review_set(payload: schemas.ReviewSetGenerateRequest, db: Session = Depends(get_db)):
     """
     セットリストからリマインダを一括生成する
     - due_date = start_date + offset_days
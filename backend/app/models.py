@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, BigInteger, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Boolean, ForeignKey, BigInteger, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -6,7 +6,8 @@ from .database import Base
 class StudyProgress(Base):
     __tablename__ = "study_progress"
 
-    id = Column(Integer, primary_key=True, index=True)
+    # 互換VIEWでは学習時間行に 52bit の負の合成IDが入るため BigInteger
+    id = Column(BigInteger, primary_key=True, index=True)
     subject = Column(String(100), nullable=False, index=True)  # 科目名（財務会計、管理会計など）
     topic = Column(String(200), nullable=False)  # トピック名
     progress_percent = Column(Float, default=0.0)  # 進捗率（0-100）
@@ -50,6 +51,10 @@ class StudyProgressLegacy(Base):
 
 class Project(Base):
     __tablename__ = "projects"
+    __table_args__ = (
+        # 一覧の並び (due_date ASC NULLS LAST, created_at DESC, id DESC) / keyset ページング用
+        Index("ix_projects_due_created_id", "due_date", text("created_at DESC"), text("id DESC")),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(500), nullable=False)  # プロジェクト名（例：租税法レギュラー答練1回目）
@@ -61,12 +66,20 @@ class Project(Base):
 
 class Todo(Base):
     __tablename__ = "todos"
+    __table_args__ = (
+        # 一覧の並び (completed ASC, created_at DESC, id DESC) / keyset ページング用
+        Index("ix_todos_completed_created_id", "completed", text("created_at DESC"), text("id DESC")),
+        # プロジェクト完了（project_id = ? AND completed = false の一括UPDATE）と
+        # プロジェクト削除時の ON DELETE SET NULL（project_id = ? の検索）用
+        Index("ix_todos_project_completed", "project_id", "completed"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(500), nullable=False)  # ToDoのタイトル
     subject = Column(String(100), nullable=True)  # 科目（財務会計、管理会計など）
     due_date = Column(DateTime(timezone=True), nullable=True)  # 日時
-    project_id = Column(Integer, ForeignKey("projects.id"), nullable=True)  # プロジェクトID
+    # プロジェクト削除時は DB 側で NULL にする（ON DELETE SET NULL）
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="SET NULL"), nullable=True)  # プロジェクトID
     completed = Column(Boolean, default=False)  # 完了/未完了
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -98,18 +111,52 @@ class StudyTimeSyncSession(Base):
     __tablename__ = "study_time_sync_sessions"
     __table_args__ = (
         UniqueConstraint("user_id", "date_key", "subject", "client_session_id", name="uq_study_time_sync"),
+        # 互換VIEW (study_progress) の GROUP BY subject, date_key 用
+        # date_key 単体の範囲検索は uq_study_time_sync (user_id, date_key, ...) で賄う
+        Index(
+            "ix_sts_default_subject_date",
+            "subject",
+            "date_key",
+            postgresql_where=text("user_id = 'default'"),
+            postgresql_include=["last_total_ms"],
+        ),
+        # 今日/今週合計 (get_study_time_summary_ms) とダッシュボード集計 (date_key, subject) の Index Only Scan 用
+        Index(
+            "ix_sts_user_date_subject",
+            "user_id",
+            "date_key",
+            "subject",
+            postgresql_include=["last_total_ms"],
+        ),
     )
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(String(100), nullable=False, index=True)
-    date_key = Column(String(10), nullable=False, index=True)  # yyyy-MM-dd
-    subject = Column(String(100), nullable=False, index=True)
+    user_id = Column(String(100), nullable=False)
+    date_key = Column(String(10), nullable=False)  # yyyy-MM-dd
+    subject = Column(String(100), nullable=False)
     client_session_id = Column(String(100), nullable=False, index=True)
     last_total_ms = Column(BigInteger, nullable=False, default=0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+class StudyTimeSubjectTotal(Base):
+    """
+    科目別の学習時間合計（study_time_sync_sessions のロールアップ）
+
+    - (user_id, subject) ごとに last_total_ms の合計を保持する
+    - 値は study_time_sync_sessions のトリガーで維持される（アプリから直接書き込まない）
+    - session_count が 0 の行は、セッションが全て削除された科目
+    """
+
+    __tablename__ = "study_time_subject_totals"
+
+    user_id = Column(String(100), primary_key=True)
+    subject = Column(String(100), primary_key=True)
+    total_ms = Column(BigInteger, nullable=False, default=0)
+    session_count = Column(Integer, nullable=False, default=0)
+
+
 class ReviewSetList(Base):
     """
     復習セットリスト（科目に依存しない汎用セット）
@@ -121,11 +168,14 @@ class ReviewSetList(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # レスポンス (ReviewSetListResponse) は常に items を含むため、一覧取得時も
+    # 1リストごとの遅延ロード(N+1)ではなく IN (...) の1クエリでまとめてロードする
     items = relationship(
         "ReviewSetItem",
         back_populates="set_list",
         cascade="all, delete-orphan",
         order_by="ReviewSetItem.id",
+        lazy="selectin",
     )
 
 
@@ -134,9 +184,13 @@ class ReviewSetItem(Base):
     復習セットのアイテム（オフセット日数）
     """
     __tablename__ = "review_set_items"
+    __table_args__ = (
+        # ReviewSetList.items の selectin ロード（set_list_id IN (...) ORDER BY id）用
+        Index("ix_review_set_items_set_list_id_id", "set_list_id", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    set_list_id = Column(Integer, ForeignKey("review_set_lists.id"), nullable=False, index=True)
+    set_list_id = Column(Integer, ForeignKey("review_set_lists.id"), nullable=False)
     offset_days = Column(Integer, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
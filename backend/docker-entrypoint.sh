@@ -23,7 +23,7 @@ alembic -c /app/alembic.ini upgrade head
 log "[BOOT] alembic upgrade head: SUCCESS"
 
 if [ $# -eq 0 ]; then
-  set -- uvicorn app.main:app --host 0.0.0.0 --port 8000
+  set -- uvicorn app.main:app --host 0.0.0.0 --port 8000 --loop uvloop --http httptools
 fi
 
 log "[BOOT] starting: $*"
@@ -7,6 +7,14 @@ import os
 # データベースファイルのパス
 DB_PATH = os.path.join(os.path.dirname(__file__), 'cpa_dashboard.db')
 
+# 追加するカラム（カラム名 -> 型）
+NEW_COLUMNS = {
+    'actual_time': 'REAL',
+    'target_time': 'REAL',
+    'variance_reason': 'VARCHAR(200)',
+    'theory_calculation_ratio': 'REAL',
+}
+
 def migrate():
     """study_progressテーブルに新しいカラムを追加"""
     if not os.path.exists(DB_PATH):
@@ -19,32 +27,18 @@ def migrate():
     try:
         # 既存のカラムを確認
         cursor.execute("PRAGMA table_info(study_progress)")
-        columns = [row[1] for row in cursor.fetchall()]
+        columns = {row[1] for row in cursor.fetchall()}
         
         # 新しいカラムを追加（存在しない場合のみ）
-        if 'actual_time' not in columns:
-            cursor.execute("ALTER TABLE study_progress ADD COLUMN actual_time REAL")
-            print("[OK] actual_timeカラムを追加しました")
-        else:
-            print("[SKIP] actual_timeカラムは既に存在します")
-        
-        if 'target_time' not in columns:
-            cursor.execute("ALTER TABLE study_progress ADD COLUMN target_time REAL")
-            print("[OK] target_timeカラムを追加しました")
-        else:
-            print("[SKIP] target_timeカラムは既に存在します")
-        
-        if 'variance_reason' not in columns:
-            cursor.execute("ALTER TABLE study_progress ADD COLUMN variance_reason VARCHAR(200)")
-            print("[OK] variance_reasonカラムを追加しました")
-        else:
-            print("[SKIP] variance_reasonカラムは既に存在します")
-        
-        if 'theory_calculation_ratio' not in columns:
-            cursor.execute("ALTER TABLE study_progress ADD COLUMN theory_calculation_ratio REAL")
-            print("[OK] theory_calculation_ratioカラムを追加しました")
-        else:
-            print("[SKIP] theory_calculation_ratioカラムは既に存在します")
+        # sqlite3 は DDL の前に暗黙の BEGIN を発行せず ALTER ごとに commit（fsync）されるため、
+        # 明示的に1トランザクションにまとめて commit を1回にする
+        cursor.execute("BEGIN")
+        for name, col_type in NEW_COLUMNS.items():
+            if name not in columns:
+                cursor.execute(f"ALTER TABLE study_progress ADD COLUMN {name} {col_type}")
+                print(f"[OK] {name}カラムを追加しました")
+            else:
+                print(f"[SKIP] {name}カラムは既に存在します")
         
         conn.commit()
         print("\nマイグレーションが完了しました！")
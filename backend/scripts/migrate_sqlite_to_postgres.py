@@ -3,7 +3,7 @@ from __future__ import annotations
 import os
 import sys
 import logging
-from typing import Any, Dict, List
+from typing import Any, Iterable, Iterator
 
 import sqlalchemy as sa
 from sqlalchemy import text
@@ -12,6 +12,16 @@ from sqlalchemy import text
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("migrate_sqlite_to_postgres")
 
+READ_CHUNK_SIZE = 10_000
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024  # bytes
+SQLITE_CACHE_KIB = 64 * 1024  # PRAGMA cache_size の負値は KiB 単位
+
+# SQLite のテーブル名 -> PostgreSQL 側の投入先
+# study_progress は Alembic 20260104_0004 で VIEW になり、実体は study_progress_legacy（VIEW には COPY できない）
+PG_TARGET_TABLES: dict[str, str] = {
+    "study_progress": "study_progress_legacy",
+}
+
 BOOL_COLUMNS: dict[str, list[str]] = {
     # SQLiteでは 0/1 になりがちだが、Postgresは boolean
     "projects": ["completed"],
@@ -75,28 +85,119 @@ def _sqlite_url_from_path(path: str) -> str:
     return f"sqlite:///{path}"
 
 
-def _fetch_all(conn: sa.Connection, table: str) -> List[Dict[str, Any]]:
-    result = conn.execute(text(f'SELECT * FROM "{table}"'))
-    rows = [dict(r._mapping) for r in result.fetchall()]
-    return rows
+def _copy_text_value(v: Any) -> str:
+    """
+    COPY（text 形式）の1フィールド表現にする。
+    - None は \\N（NULL）
+    - バックスラッシュ / タブ / 改行はエスケープする
+    """
+    if v is None:
+        return "\\N"
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    return str(v).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
 
 
-def _count(conn: sa.Connection, table: str) -> int:
-    return int(conn.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar() or 0)
+class _CopyStream:
+    """
+    行イテレータを COPY FROM STDIN 用の file-like にする。
+    psycopg2 の copy_expert が read(size) で少しずつ読むため、全行をメモリに載せない。
+    """
 
+    def __init__(self, rows: Iterable[Iterable[Any]]):
+        self._lines: Iterator[str] = ("\t".join(map(_copy_text_value, row)) + "\n" for row in rows)
+        self._buf = ""
+
+    def read(self, size: int = -1) -> str:
+        parts = [self._buf]
+        n = len(self._buf)
+        while size < 0 or n < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            parts.append(line)
+            n += len(line)
+        data = "".join(parts)
+        if size < 0:
+            self._buf = ""
+            return data
+        self._buf = data[size:]
+        return data[:size]
+
+
+def _copy_table(sqlite_conn: sa.Connection, pg_conn: sa.Connection, table: str, target: str) -> int:
+    """
+    SQLite の table を PostgreSQL の target へ COPY FROM STDIN で投入し、件数を返す。
+    - 行ごとの INSERT（SQL の解析・プラン）を通さず、1本のストリームで送る
+    - pg_conn と同じ DBAPI 接続で実行するため、呼び出し側のトランザクションに含まれる
+    """
+    # SQLite からは READ_CHUNK_SIZE 行ずつ fetchmany で読み、表全体を Python に載せない
+    result = sqlite_conn.execute(text(f'SELECT * FROM "{table}"')).yield_per(READ_CHUNK_SIZE)
+    cols = list(result.keys())
+    rows: Iterable[Any] = result
+
+    # boolean列の正規化（SQLite int → Postgres boolean）
+    bool_idx = [cols.index(c) for c in BOOL_COLUMNS.get(table, []) if c in cols]
+    if bool_idx:
+
+        def _normalized(src: Iterable[Any]) -> Iterator[list[Any]]:
+            for row in src:
+                r = list(row)
+                for i in bool_idx:
+                    r[i] = _normalize_bool(r[i])
+                yield r
+
+        rows = _normalized(rows)
+
+    col_list = ", ".join([f'"{c}"' for c in cols])
+    cur = pg_conn.connection.dbapi_connection.cursor()
+    try:
+        cur.copy_expert(f'COPY "{target}" ({col_list}) FROM STDIN', _CopyStream(rows))
+        return int(cur.rowcount)
+    finally:
+        cur.close()
+
+
+def _counts(conn: sa.Connection, tables: list[str]) -> dict[str, int]:
+    """tables の行数を UNION ALL の1クエリで数える"""
+    sql = " UNION ALL ".join(f'SELECT {i} AS k, COUNT(*) AS c FROM "{t}"' for i, t in enumerate(tables))
+    return {tables[k]: int(c) for k, c in conn.execute(text(sql))}
 
-def _set_sequence(conn: sa.Connection, table: str, pk: str = "id") -> None:
+
+def _drop_secondary_indexes(conn: sa.Connection, tables: list[str]) -> list[str]:
+    """
+    tables の二次インデックスを DROP し、再作成用の CREATE INDEX 文を返す。
+    - 一括投入中のインデックス更新を省き、投入後に1回でまとめて作る
+    - 制約（PK/UNIQUE/FK が参照するもの）と UNIQUE インデックスは残す（重複は投入時に検出する）
+    - DDL もトランザクション内なので、失敗時はロールバックで元に戻る
+    """
+    rows = conn.execute(
+        text(
+            """
+            SELECT i.indexrelid::regclass::text AS name, pg_get_indexdef(i.indexrelid) AS ddl
+            FROM pg_index i
+            WHERE i.indrelid = ANY(CAST(:tables AS regclass[]))
+              AND NOT i.indisunique
+              AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+            """
+        ),
+        {"tables": tables},
+    ).all()
+    for name, _ in rows:
+        conn.execute(text(f"DROP INDEX {name}"))
+    return [ddl for _, ddl in rows]
+
+
+def _set_sequences(conn: sa.Connection, tables: list[str], pk: str = "id") -> None:
+    """tables の serial シーケンスを MAX(pk) に合わせる（全テーブル分を1文で実行）"""
     # Postgres only
-    sql = text(
-        """
-        SELECT setval(
-          pg_get_serial_sequence(:tbl, :pk),
-          COALESCE((SELECT MAX(id) FROM """ + table + """), 1),
-          true
-        );
-        """
+    calls = ",\n".join(
+        f"""setval(pg_get_serial_sequence(:tbl{i}, :pk), COALESCE((SELECT MAX("{pk}") FROM "{t}"), 1), true)"""
+        for i, t in enumerate(tables)
     )
-    conn.execute(sql, {"tbl": table, "pk": pk})
+    params: dict[str, str] = {f"tbl{i}": t for i, t in enumerate(tables)}
+    params["pk"] = pk
+    conn.execute(text(f"SELECT {calls}"), params)
 
 
 def main() -> int:
@@ -116,6 +217,20 @@ def main() -> int:
     logger.info(f"[CONFIG] DATABASE_URL={_mask_url(pg_url)}")
 
     sqlite_engine = sa.create_engine(sqlite_url, connect_args={"check_same_thread": False})
+
+    @sa.event.listens_for(sqlite_engine, "connect")
+    def _sqlite_read_pragmas(dbapi_conn, _record) -> None:
+        # 読み出し専用の全件走査向け: mmap で read() システムコールを減らし、ページキャッシュを広げる
+        # - query_only: 移行元を誤って書き換えない（journal_mode など永続する設定は変えない）
+        cur = dbapi_conn.cursor()
+        for pragma in (
+            f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+            f"PRAGMA cache_size=-{SQLITE_CACHE_KIB}",
+            "PRAGMA temp_store=MEMORY",
+            "PRAGMA query_only=ON",
+        ):
+            cur.execute(pragma)
+        cur.close()
     pg_engine = sa.create_engine(pg_url, pool_pre_ping=True)
 
     tables_in_order = [
@@ -138,9 +253,11 @@ def main() -> int:
         try:
             logger.info("[MIGRATE] starting transaction (pg_engine.begin())")
             with pg_engine.begin() as pg_conn:
+                targets = [PG_TARGET_TABLES.get(t, t) for t in tables_in_order]
+
                 # Ensure postgres schema exists (alembic should have run already)
                 pg_tables = set(sa.inspect(pg_conn).get_table_names())
-                missing = [t for t in tables_in_order if t not in pg_tables]
+                missing = [t for t in targets if t not in pg_tables]
                 if missing:
                     raise RuntimeError(
                         f"PostgreSQL schema is missing tables: {missing}. Run `alembic upgrade head` first."
@@ -148,7 +265,7 @@ def main() -> int:
 
                 # Safety: stop if postgres already has data (unless forced)
                 force = os.getenv("MIGRATE_FORCE") == "1"
-                existing_counts = {t: _count(pg_conn, t) for t in tables_in_order if t in pg_tables}
+                existing_counts = _counts(pg_conn, targets)
                 non_empty = {t: c for t, c in existing_counts.items() if c > 0}
                 if non_empty and not force:
                     raise RuntimeError(
@@ -156,41 +273,21 @@ def main() -> int:
                         "Abort to avoid duplicates. Set MIGRATE_FORCE=1 to override."
                     )
 
-                for table in tables_in_order:
-                    src_rows = _fetch_all(sqlite_conn, table)
-                    logger.info(f"[MIGRATE] {table}: rows={len(src_rows)}")
-
-                    if not src_rows:
-                        continue
-
-                    # Insert in chunks
-                    cols = list(src_rows[0].keys())
-                    col_list = ", ".join([f'"{c}"' for c in cols])
-                    val_list = ", ".join([f":{c}" for c in cols])
-                    insert_sql = text(f'INSERT INTO "{table}" ({col_list}) VALUES ({val_list})')
-
-                    chunk_size = 1000
-                    for i in range(0, len(src_rows), chunk_size):
-                        chunk = src_rows[i : i + chunk_size]
-
-                        # boolean列の正規化（SQLite int → Postgres boolean）
-                        bool_cols = BOOL_COLUMNS.get(table)
-                        if bool_cols:
-                            normalized_chunk: list[dict[str, Any]] = []
-                            for row in chunk:
-                                r = dict(row)
-                                for c in bool_cols:
-                                    if c in r:
-                                        r[c] = _normalize_bool(r[c])
-                                normalized_chunk.append(r)
-                            chunk = normalized_chunk
-
-                        pg_conn.execute(insert_sql, chunk)
+                # トリガー（study_time_subject_totals のロールアップ）と FK チェックは有効なまま投入する
+                index_ddls = _drop_secondary_indexes(pg_conn, targets)
+                logger.info(f"[MIGRATE] dropped secondary indexes: {len(index_ddls)}")
+
+                for table, target in zip(tables_in_order, targets):
+                    copied = _copy_table(sqlite_conn, pg_conn, table, target)
+                    logger.info(f"[MIGRATE] {table} -> {target}: rows={copied}")
+
+                for ddl in index_ddls:
+                    pg_conn.execute(text(ddl))
+                logger.info(f"[MIGRATE] recreated secondary indexes: {len(index_ddls)}")
 
                 # Adjust sequences
-                for table in ["projects", "study_progress", "settings", "study_time_sync_sessions", "todos"]:
-                    logger.info(f"[MIGRATE] set sequence: {table}.id")
-                    _set_sequence(pg_conn, table, "id")
+                logger.info(f"[MIGRATE] set sequences: {', '.join(f'{t}.id' for t in targets)}")
+                _set_sequences(pg_conn, targets, "id")
 
             logger.info("[MIGRATE] SUCCESS (committed)")
             return 0